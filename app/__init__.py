@@ -0,0 +1,4 @@
+from dotenv import load_dotenv
+
+# Load .env once, before any submodule reads its configuration from the environment
+load_dotenv()
@@ -0,0 +1,109 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from .models import (
+    DetectedItem,
+    MarketCandidate,
+    UserPreferences,
+)
+from .metrics import CACHE_LOOKUPS
+
+# --- Solution Cache Configuration ---
+SOLUTION_CACHE_SIZE = int(os.getenv("SOLUTION_CACHE_SIZE", "1024"))
+
+# Returned by `get()` on a miss, since `None` is a valid cached result ("no solution")
+MISSING = object()
+
+
+def canonical_request_key(
+        detected_items: List[DetectedItem],
+        candidates_map: Dict[str, List[MarketCandidate]],
+        preferences: UserPreferences,
+        max_total_budget: float,
+        fixed_items: Optional[Dict[str, str]] = None,
+        max_delivery_days: Optional[int] = None,
+) -> str:
+    """
+    Stable hash of everything that can change the optimizer's answer.
+    `is_selected` and `url` are ignored; list order is kept because it breaks score ties.
+    """
+    canonical = {
+        "items": [(item.name, item.quantity) for item in detected_items],
+        "candidates": {
+            item_name: [
+                (
+                    c.name, c.price, c.delivery_days, c.quality_score,
+                    [(t.min_quantity, t.unit_price) for t in c.price_tiers or []], c.stock, c.min_order_quantity,
+                )
+                for c in category
+            ]
+            for item_name, category in candidates_map.items()
+        },
+        "weights": (preferences.price_weight, preferences.delivery_weight, preferences.quality_weight),
+        "budget": max_total_budget,
+        "fixed": fixed_items or {},
+        "deadline": max_delivery_days,
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+class SolutionCache:
+    """
+    Bounded LRU map from canonical request key to a compact optimizer result.
+    Also used for other content-addressed results (e.g. extracted quote pages);
+    `name` labels its hits and misses in the metrics.
+    """
+
+    def __init__(self, max_size: int = SOLUTION_CACHE_SIZE, name: str = "solution"):
+        self.max_size = max_size
+        self.name = name
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                CACHE_LOOKUPS.inc(cache=self.name, result="miss")
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            CACHE_LOOKUPS.inc(cache=self.name, result="hit")
+            return self._entries[key]
+
+    def put(self, key: str, value: Any):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+solution_cache = SolutionCache()
@@ -0,0 +1,468 @@
+import os
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, List, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .models import (
+    DetectedItem,
+    MarketCandidate,
+    PriceTier,
+    UserPreferences,
+    Solution,
+    CandidateSensitivity,
+)
+from .services import ProcurementOptimizer
+from .cache import MISSING, canonical_request_key, solution_cache
+from .metrics import STAGE_DURATION, OPTIMIZER_NODES
+from .tracing import span, current_span
+from .profiling import profiling_active
+
+# --- Solver Executor Configuration ---
+# "process" offloads big solves to a warm process pool, "thread" keeps them in-process
+# but off the event loop, "inline" runs everything on the event loop (old behaviour).
+SOLVER_EXECUTOR = os.getenv("SOLVER_EXECUTOR", "process")
+SOLVER_WORKERS = int(os.getenv("SOLVER_WORKERS", str(os.cpu_count() or 1)))
+# Number of combinations the brute-force search has to visit before we bother offloading.
+SOLVER_OFFLOAD_THRESHOLD = int(os.getenv("SOLVER_OFFLOAD_THRESHOLD", "2000"))
+# Max solves queued or running in the pool before new ones are rejected with 503.
+SOLVER_MAX_PENDING = int(os.getenv("SOLVER_MAX_PENDING", str(SOLVER_WORKERS * 4)))
+
+# Compact wire format sent to worker processes
+# items:      [(name, quantity), ...]
+# candidates: {item_name: [(price, delivery_days, quality_score, ((min_quantity, unit_price), ...) or None,
+#                           stock, min_order_quantity), ...]}
+# fixed:      {item_name: candidate_index}
+# deadline:   max_delivery_days or None
+# result:     ({item_name: candidate_index}, total_cost, max_delivery_days) or None
+# Workers also return the optimizer's `stats` so metrics are recorded in the parent process.
+CompactPayload = Tuple[
+    List[Tuple[str, int]],
+    Dict[str, List[Tuple[float, int, float, Optional[Tuple[Tuple[int, float], ...]], Optional[int], int]]],
+    Tuple[float, float, float],
+    float,
+    Dict[str, int],
+    Optional[int],
+]
+CompactResult = Optional[Tuple[Dict[str, int], float, int]]
+
+
+def _warm_up() -> int:
+    """
+    No-op task submitted when the pool is created, so every worker process
+    starts and imports `app.services` at once instead of as later solves need it.
+    """
+    return os.getpid()
+
+
+def _solve_compact(payload: CompactPayload) -> Tuple[CompactResult, Dict[str, float]]:
+    """
+    Runs inside a worker process. Rebuilds lightweight models from the compact
+    payload, solves, and returns candidate indices instead of full models.
+    """
+    items, candidates, weights, budget, fixed, deadline = payload
+
+    detected_items = [DetectedItem(name=name, quantity=quantity) for name, quantity in items]
+    candidates_map = {
+        item_name: [
+            MarketCandidate(
+                name=str(i), price=price, delivery_days=days, quality_score=quality, url="",
+                price_tiers=None if tiers is None else [
+                    PriceTier(min_quantity=min_quantity, unit_price=unit_price) for min_quantity, unit_price in tiers
+                ],
+                stock=stock, min_order_quantity=min_order_quantity,
+            )
+            for i, (price, days, quality, tiers, stock, min_order_quantity) in enumerate(rows)
+        ]
+        for item_name, rows in candidates.items()
+    }
+    preferences = UserPreferences(
+        price_weight=weights[0],
+        delivery_weight=weights[1],
+        quality_weight=weights[2],
+    )
+    fixed_items = {item_name: str(index) for item_name, index in fixed.items()}
+
+    optimizer = ProcurementOptimizer()
+    solution = optimizer.find_constrained_optimal_setup(
+        detected_items=detected_items,
+        candidates_map=candidates_map,
+        preferences=preferences,
+        max_total_budget=budget,
+        fixed_items=fixed_items,
+        max_delivery_days=deadline,
+    )
+    if solution is None:
+        return None, optimizer.stats
+
+    indices = {item_name: int(c.name) for item_name, c in solution.selections.items()}
+    return (indices, solution.total_cost, solution.max_delivery_days), optimizer.stats
+
+
+def _sensitivity(*args) -> Tuple[Optional[Tuple[List[CandidateSensitivity], float]], Dict[str, float]]:
+    optimizer = ProcurementOptimizer()
+    return optimizer.price_sensitivity(*args), optimizer.stats
+
+
+def _batch(*args) -> Tuple[Optional[List[Dict[str, int]]], Dict[str, float]]:
+    optimizer = ProcurementOptimizer()
+    return optimizer.find_batch_optimal_setup(*args), optimizer.stats
+
+
+def _split(*args) -> Tuple[Optional[Dict[str, Dict[int, int]]], Dict[str, float]]:
+    optimizer = ProcurementOptimizer()
+    return optimizer.find_split_sourcing_setup(*args), optimizer.stats
+
+
+def _record_optimizer_stats(stats: Dict[str, float]):
+    solve_span = current_span()
+    if solve_span is not None:
+        solve_span.attributes.update(stats)
+    OPTIMIZER_NODES.inc(stats["nodes_explored"])
+    STAGE_DURATION.observe(stats["scoring_seconds"], stage="scoring")
+    STAGE_DURATION.observe(stats["solve_seconds"], stage="solve")
+
+
+def _pool_context() -> multiprocessing.context.BaseContext:
+    """
+    Workers start from a clean interpreter instead of forking the server, which by then
+    holds the event loop, client threads and open sockets.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+class SolverExecutor:
+    """
+    Decides where a solve runs (event loop, thread or process pool) and applies
+    back-pressure when too many heavy solves are in flight.
+    """
+
+    def __init__(
+            self,
+            mode: str = SOLVER_EXECUTOR,
+            max_workers: int = SOLVER_WORKERS,
+            offload_threshold: int = SOLVER_OFFLOAD_THRESHOLD,
+            max_pending: int = SOLVER_MAX_PENDING,
+    ):
+        self.mode = mode
+        self.max_workers = max(1, max_workers)
+        self.offload_threshold = offload_threshold
+        self.max_pending = max_pending
+        self._pool: Optional[Executor] = None
+        self._pending = 0
+        # Held while the pool is created or shut down, which may happen off the event loop
+        self._pool_lock = threading.Lock()
+
+    def start(self):
+        """
+        Creates the pool and starts warming every worker without waiting for them. Called
+        by `_offload()` on a worker thread when the first solve needs the pool, since
+        launching worker processes blocks; starting them with the app would compete with
+        the cold start for the CPU.
+        """
+        with self._pool_lock:
+            if self._pool is not None or self.mode == "inline":
+                return
+            if self.mode == "process":
+                pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=_pool_context())
+                for _ in range(self.max_workers):
+                    pool.submit(_warm_up)
+                self._pool = pool
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="solver")
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    @staticmethod
+    def estimate_search_space(
+            detected_items: List[DetectedItem],
+            candidates_map: Dict[str, List[MarketCandidate]],
+            fixed_items: Optional[Dict[str, str]] = None,
+            max_delivery_days: Optional[int] = None,
+    ) -> int:
+        """
+        Number of leaf combinations the optimizer will visit (at most; budget pruning cuts more).
+        """
+        fixed_items = fixed_items or {}
+        size = 1
+        for item in detected_items:
+            if item.name in fixed_items:
+                continue
+            eligible = [c for c in candidates_map.get(item.name, []) if c.can_supply(item.quantity, max_delivery_days)]
+            size *= max(1, len(eligible))
+        return size
+
+    async def solve(
+            self,
+            detected_items: List[DetectedItem],
+            candidates_map: Dict[str, List[MarketCandidate]],
+            preferences: UserPreferences,
+            max_total_budget: float,
+            fixed_items: Optional[Dict[str, str]] = None,
+            max_delivery_days: Optional[int] = None,
+    ) -> Optional[Solution]:
+        # Identical requests (e.g. preference toggled back) are answered from the cache
+        with span("optimizer.solve", items=len(detected_items)) as solve_span:
+            key = canonical_request_key(
+                detected_items, candidates_map, preferences, max_total_budget, fixed_items, max_delivery_days,
+            )
+            cached = solution_cache.get(key)
+            solve_span.set_attribute("cache_hit", cached is not MISSING)
+            if cached is not MISSING:
+                return self._unpack(cached, detected_items, candidates_map)
+
+            result = await self._solve_uncached(
+                detected_items, candidates_map, preferences, max_total_budget, fixed_items, max_delivery_days,
+            )
+            solution_cache.put(key, result)
+            return self._unpack(result, detected_items, candidates_map)
+
+    async def _solve_uncached(
+            self,
+            detected_items: List[DetectedItem],
+            candidates_map: Dict[str, List[MarketCandidate]],
+            preferences: UserPreferences,
+            max_total_budget: float,
+            fixed_items: Optional[Dict[str, str]],
+            max_delivery_days: Optional[int],
+    ) -> CompactResult:
+        size = self.estimate_search_space(detected_items, candidates_map, fixed_items, max_delivery_days)
+        # Profiled requests solve inline so the profile includes the search recursion
+        offload = self.mode != "inline" and size >= self.offload_threshold and not profiling_active.get()
+        solve_span = current_span()
+        if solve_span is not None:
+            solve_span.set_attribute("search_space", size)
+            solve_span.set_attribute("executor", self.mode if offload else "inline")
+        if not offload:
+            optimizer = ProcurementOptimizer()
+            solution = optimizer.find_constrained_optimal_setup(
+                detected_items=detected_items,
+                candidates_map=candidates_map,
+                preferences=preferences,
+                max_total_budget=max_total_budget,
+                fixed_items=fixed_items,
+                max_delivery_days=max_delivery_days,
+            )
+            _record_optimizer_stats(optimizer.stats)
+            return self._compact(solution, candidates_map)
+
+        if self.mode == "process":
+            payload = self._pack(
+                detected_items, candidates_map, preferences, max_total_budget, fixed_items, max_delivery_days,
+            )
+            if payload is None:
+                return None
+            result, stats = await self._offload(_solve_compact, payload)
+            _record_optimizer_stats(stats)
+            return result
+
+        optimizer = ProcurementOptimizer()
+        solution = await self._offload(
+            lambda: optimizer.find_constrained_optimal_setup(
+                detected_items=detected_items,
+                candidates_map=candidates_map,
+                preferences=preferences,
+                max_total_budget=max_total_budget,
+                fixed_items=fixed_items,
+                max_delivery_days=max_delivery_days,
+            ),
+        )
+        _record_optimizer_stats(optimizer.stats)
+        return self._compact(solution, candidates_map)
+
+    async def _offload(self, fn: Callable, *args):
+        """
+        Runs `fn(*args)` on the pool, rejecting with 503 when too much is already in flight.
+        """
+        if self._pending >= self.max_pending:
+            raise HTTPException(
+                status_code=503,
+                detail="Optimizer is at capacity. Please retry shortly.",
+                headers={"Retry-After": "1"},
+            )
+
+        self._pending += 1
+        try:
+            if self._pool is None:
+                await asyncio.to_thread(self.start)
+            return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+        finally:
+            self._pending -= 1
+
+    async def price_sensitivity(
+            self,
+            detected_items: List[DetectedItem],
+            candidates_map: Dict[str, List[MarketCandidate]],
+            preferences: UserPreferences,
+            max_total_budget: float,
+            fixed_items: Optional[Dict[str, str]] = None,
+            max_delivery_days: Optional[int] = None,
+    ) -> Optional[Tuple[List[CandidateSensitivity], float]]:
+        """
+        Price thresholds for every candidate (see `ProcurementOptimizer.price_sensitivity`).
+        Always offloaded unless running inline or profiled: the DP tables cost
+        the same whatever the search space of the brute-force solve would be.
+        """
+        args = (detected_items, candidates_map, preferences, max_total_budget, fixed_items, max_delivery_days)
+        with span("optimizer.sensitivity", items=len(detected_items)):
+            if self.mode == "inline" or profiling_active.get():
+                result, stats = _sensitivity(*args)
+            else:
+                result, stats = await self._offload(_sensitivity, *args)
+            STAGE_DURATION.observe(stats["scoring_seconds"], stage="scoring")
+            STAGE_DURATION.observe(stats["solve_seconds"], stage="sensitivity")
+            return result
+
+    async def solve_batch(
+            self,
+            sites: List[Tuple[List[DetectedItem], Optional[float], Dict[str, str]]],
+            candidates_map: Dict[str, List[MarketCandidate]],
+            preferences: UserPreferences,
+            max_total_budget: float,
+            max_delivery_days: Optional[int] = None,
+    ) -> Optional[List[Solution]]:
+        """
+        One solution per site under a shared budget (see `ProcurementOptimizer.find_batch_optimal_setup`).
+        """
+        args = (sites, candidates_map, preferences, max_total_budget, max_delivery_days)
+        with span("optimizer.batch", sites=len(sites)):
+            if self.mode == "inline" or profiling_active.get():
+                result, stats = _batch(*args)
+            else:
+                result, stats = await self._offload(_batch, *args)
+            _record_optimizer_stats(stats)
+            if result is None:
+                return None
+            return [
+                self._solution_from_indices(indices, detected_items, candidates_map)
+                for indices, (detected_items, _, _) in zip(result, sites)
+            ]
+
+    async def solve_split(
+            self,
+            detected_items: List[DetectedItem],
+            candidates_map: Dict[str, List[MarketCandidate]],
+            preferences: UserPreferences,
+            max_total_budget: float,
+            fixed_items: Optional[Dict[str, str]] = None,
+            max_delivery_days: Optional[int] = None,
+    ) -> Optional[Solution]:
+        """
+        Split-sourcing solve (see `ProcurementOptimizer.find_split_sourcing_setup`). Its cost
+        grows with quantities rather than with the search space, so it is always offloaded.
+        """
+        args = (detected_items, candidates_map, preferences, max_total_budget, fixed_items, max_delivery_days)
+        with span("optimizer.split", items=len(detected_items)):
+            if self.mode == "inline" or profiling_active.get():
+                result, stats = _split(*args)
+            else:
+                result, stats = await self._offload(_split, *args)
+            _record_optimizer_stats(stats)
+            if result is None:
+                return None
+
+            selections: Dict[str, MarketCandidate] = {}
+            allocations: Dict[str, Dict[str, int]] = {}
+            total_cost = 0.0
+            for item_name, units_by_index in result.items():
+                candidates = candidates_map[item_name]
+                allocations[item_name] = {candidates[index].name: units for index, units in units_by_index.items()}
+                total_cost += sum(candidates[index].cost(units) for index, units in units_by_index.items())
+                if units_by_index:
+                    selections[item_name] = candidates[max(units_by_index, key=units_by_index.get)]
+            used = [candidates_map[item_name][index] for item_name, units in result.items() for index in units]
+            return Solution(
+                selections=selections,
+                total_cost=total_cost,
+                max_delivery_days=max((c.delivery_days for c in used), default=0),
+                allocations=allocations,
+            )
+
+    @staticmethod
+    def _solution_from_indices(
+            indices: Dict[str, int],
+            detected_items: List[DetectedItem],
+            candidates_map: Dict[str, List[MarketCandidate]],
+    ) -> Solution:
+        quantity_map = {item.name: item.quantity for item in detected_items}
+        selections = {item_name: candidates_map[item_name][index] for item_name, index in indices.items()}
+        return Solution(
+            selections=selections,
+            total_cost=sum(c.cost(quantity_map[name]) for name, c in selections.items()),
+            max_delivery_days=max((c.delivery_days for c in selections.values()), default=0),
+        )
+
+    @staticmethod
+    def _pack(
+            detected_items: List[DetectedItem],
+            candidates_map: Dict[str, List[MarketCandidate]],
+            preferences: UserPreferences,
+            max_total_budget: float,
+            fixed_items: Optional[Dict[str, str]],
+            max_delivery_days: Optional[int],
+    ) -> Optional[CompactPayload]:
+        items = [(item.name, item.quantity) for item in detected_items]
+        candidates = {
+            item_name: [
+                (
+                    c.price, c.delivery_days, c.quality_score,
+                    None if c.price_tiers is None else tuple((t.min_quantity, t.unit_price) for t in c.price_tiers),
+                    c.stock, c.min_order_quantity,
+                )
+                for c in category
+            ]
+            for item_name, category in candidates_map.items()
+        }
+        weights = (preferences.price_weight, preferences.delivery_weight, preferences.quality_weight)
+
+        fixed: Dict[str, int] = {}
+        for item_name, candidate_name in (fixed_items or {}).items():
+            for index, c in enumerate(candidates_map.get(item_name, [])):
+                if c.name == candidate_name:
+                    fixed[item_name] = index
+                    break
+            else:
+                # Same outcome as the optimizer: an unknown fixed candidate has no solution
+                if any(item.name == item_name for item in detected_items):
+                    return None
+
+        return items, candidates, weights, max_total_budget, fixed, max_delivery_days
+
+    @staticmethod
+    def _compact(
+            solution: Optional[Solution],
+            candidates_map: Dict[str, List[MarketCandidate]],
+    ) -> CompactResult:
+        if solution is None:
+            return None
+        indices: Dict[str, int] = {}
+        for item_name, selected in solution.selections.items():
+            for index, c in enumerate(candidates_map[item_name]):
+                if c is selected:
+                    indices[item_name] = index
+                    break
+        return indices, solution.total_cost, solution.max_delivery_days
+
+    @staticmethod
+    def _unpack(
+            result: CompactResult,
+            detected_items: List[DetectedItem],
+            candidates_map: Dict[str, List[MarketCandidate]],
+    ) -> Optional[Solution]:
+        if result is None:
+            return None
+        indices, total_cost, max_delivery_days = result
+        selections = {item_name: candidates_map[item_name][index] for item_name, index in indices.items()}
+        return Solution(selections=selections, total_cost=total_cost, max_delivery_days=max_delivery_days)
+
+
+solver_executor = SolverExecutor()
@@ -0,0 +1,114 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+# --- Negotiation History Configuration ---
+NEGOTIATION_DB_PATH = os.getenv("NEGOTIATION_DB_PATH", "negotiations.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY,
+    vendor_name TEXT NOT NULL,
+    item_name TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id INTEGER NOT NULL REFERENCES conversations(id),
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    parsed_price REAL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_vendor ON conversations(vendor_name, item_name);
+CREATE INDEX IF NOT EXISTS idx_turns_conversation ON turns(conversation_id);
+CREATE INDEX IF NOT EXISTS idx_turns_priced ON turns(conversation_id, parsed_price) WHERE parsed_price IS NOT NULL;
+"""
+
+
+class NegotiationHistory:
+    """
+    SQLite (WAL) store of NegBot conversations, their turns and any prices parsed from vendor replies.
+    One connection guarded by a lock; every statement is a short point query or insert.
+    """
+
+    def __init__(self, path: str = NEGOTIATION_DB_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def record_conversation(self, conversation_id: int, vendor_name: str, item_name: Optional[str] = None):
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO conversations (id, vendor_name, item_name, created_at) VALUES (?, ?, ?, ?)",
+                (conversation_id, vendor_name, item_name, time.time()),
+            )
+
+    def record_exchange(
+            self,
+            conversation_id: int,
+            user_message: str,
+            vendor_reply: str,
+            parsed_price: Optional[float] = None,
+    ):
+        """
+        One turn each way, committed together.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(
+                    "INSERT INTO turns (conversation_id, role, content, parsed_price, created_at) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (conversation_id, "user", user_message, None, now),
+                        (conversation_id, "vendor", vendor_reply, parsed_price, now),
+                    ],
+                )
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def best_prices(self, vendor_names: Iterable[str], item_name: Optional[str] = None) -> Dict[str, float]:
+        """
+        Lowest price any vendor in `vendor_names` has offered so far, optionally for one item only.
+        """
+        names: List[str] = list(vendor_names)
+        if not names:
+            return {}
+        placeholders = ",".join("?" * len(names))
+        query = (
+            "SELECT c.vendor_name, MIN(t.parsed_price) FROM conversations c "
+            "JOIN turns t ON t.conversation_id = c.id "
+            f"WHERE t.parsed_price IS NOT NULL AND c.vendor_name IN ({placeholders})"
+        )
+        params: List = list(names)
+        if item_name is not None:
+            query += " AND (c.item_name = ? OR c.item_name IS NULL)"
+            params.append(item_name)
+        query += " GROUP BY c.vendor_name"
+        with self._lock:
+            rows = self._connection().execute(query, params).fetchall()
+        return {vendor_name: price for vendor_name, price in rows}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+negotiation_history = NegotiationHistory()
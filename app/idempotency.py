@@ -0,0 +1,98 @@
+import os
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from starlette.types import Scope
+
+from .metrics import CACHE_LOOKUPS
+from .ratelimit import client_id
+
+# --- Idempotency Configuration ---
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def request_fingerprint(request: BaseModel) -> str:
+    return hashlib.blake2b(request.model_dump_json().encode("utf-8"), digest_size=16).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Remembers the result of each Idempotency-Key for a bounded window. Keys are scoped to
+    the client (as identified by the rate limiter: a listed API key, else the address) and
+    to the method and path, so two clients choosing the same key never see each other's results.
+    A retry with the same key gets the stored result; a retry that arrives while the
+    original is still running waits for it instead of calling upstream again.
+    Failures are not stored, so the client can retry them.
+    """
+
+    def __init__(self, ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # (client, method, path, key) -> (fingerprint, expires_at, future holding the result)
+        self._entries: "OrderedDict[Tuple[str, str, str, str], Tuple[str, float, asyncio.Future]]" = OrderedDict()
+
+    def _evict(self, now: float):
+        # Entries share one TTL, so insertion order is expiry order
+        for entry_key, (_, expires_at, future) in list(self._entries.items()):
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            if future.done():  # Never drop in-flight work
+                del self._entries[entry_key]
+
+    async def run(
+            self,
+            scope: Scope,
+            key: Optional[str],
+            fingerprint: str,
+            compute: Callable[[], Awaitable[Any]],
+    ) -> Tuple[Any, bool]:
+        """
+        Returns `(result, replayed)`. Without a key, `compute` simply runs.
+        """
+        if not key:
+            return await compute(), False
+        if len(key) > 255:
+            raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} must be at most 255 characters.")
+
+        now = time.monotonic()
+        self._evict(now)
+        entry_key = (client_id(scope), scope["method"], scope["path"], key)
+        entry = self._entries.get(entry_key)
+        if entry is not None and entry[1] > now:
+            stored_fingerprint, _, future = entry
+            if stored_fingerprint != fingerprint:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"{IDEMPOTENCY_HEADER} was already used with a different request body.",
+                )
+            CACHE_LOOKUPS.inc(cache="idempotency", result="hit")
+            return await asyncio.shield(future), True
+
+        CACHE_LOOKUPS.inc(cache="idempotency", result="miss")
+        future = asyncio.get_running_loop().create_future()
+        self._entries[entry_key] = (fingerprint, now + self.ttl_seconds, future)
+        try:
+            result = await compute()
+        except BaseException as e:
+            self._entries.pop(entry_key, None)
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Mark retrieved so failures nobody waited on don't log "exception never retrieved"
+                future.exception()
+            raise
+        future.set_result(result)
+        return result, False
+
+
+idempotency_store = IdempotencyStore()
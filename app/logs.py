@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import queue
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from .tracing import current_trace_id
+
+# --- Logging Configuration ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" (one object per line) or "text"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # Records beyond this are dropped, never waited on
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s %(message)s"
+# Libraries that log every outbound request at INFO (the OpenAI SDK uses httpx)
+QUIET_LOGGERS = ("httpx", "httpcore")
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: timestamp, level, logger, message, the trace id of the
+    request that logged it, and any structured fields passed to `log()`.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        sample_rate = getattr(record, "sample_rate", 1.0)
+        if sample_rate < 1.0:
+            entry["sample_rate"] = sample_rate  # Each logged line stands for 1/sample_rate events
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread. The request path only pays for the message
+    interpolation and a queue put; when the queue is full the record is dropped rather
+    than blocking the event loop.
+    """
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting (JSON, tracebacks) happens on the listener thread; only capture what
+        # can't be recovered there: the message arguments and the request's trace id
+        record.msg = record.getMessage()
+        record.args = None
+        record.trace_id = current_trace_id()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[_QueueHandler] = None
+
+
+def configure_logging():
+    """
+    Routes every logger through a bounded queue to a stdout handler on a background
+    thread. Called when the app starts; does nothing if logging is already running, and
+    can run again after `shutdown_logging()` (e.g. a second lifespan in the same process).
+    """
+    global _listener, _handler
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    _handler = _QueueHandler(log_queue)
+    root.addHandler(_handler)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(max(root.level, logging.WARNING))
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+
+
+def shutdown_logging():
+    """
+    Writes out whatever is still queued and detaches the queue from the root logger, so
+    nothing is logged into a queue no thread reads any more; called when the app stops.
+    """
+    global _listener, _handler
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log(logger: logging.Logger, level: int, message: str, sample_rate: float = 1.0, **fields: Any):
+    """
+    Logs `message` with structured `fields`. High-frequency events pass a `sample_rate`
+    below 1 so only that fraction is logged; the record carries the rate so counts can
+    be scaled back up. Disabled levels and unsampled events cost almost nothing.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return
+    logger.log(level, message, extra={"fields": fields, "sample_rate": sample_rate})
@@ -1,10 +1,16 @@
+import os
+import json
 import random
+import asyncio
+import importlib
+import logging
+from contextlib import asynccontextmanager
 from typing import List, Dict, Optional
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Header, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from dotenv import load_dotenv
+from fastapi.responses import PlainTextResponse, FileResponse
+from pydantic import BaseModel, Field
 
 from .models import (
     ImageAnalysisResponse,
@@ -12,21 +18,93 @@ from .models import (
     MarketCandidate,
     UserPreferences,
     SearchResponse,
+    BatchSearchResponse,
+    SiteSolution,
     NegotiationResponse,
     RecalculateRequest,
+    SensitivityRequest,
+    SensitivityResponse,
+    CandidateListingOptions,
+    QuoteIngestionResponse,
+    Solution,
 )
-from .services import ProcurementOptimizer, analyze_image, find_product_image  # <--- Imported find_product_image
-from .negotiation_service import NegotiationService
+from .services import (
+    analyze_image,
+    find_product_image,
+    find_product_images,
+    normalize_product_name,
+    apply_listing_options,
+    listing_field_exclusions,
+)  # <--- Imported find_product_image
+from .executor import solver_executor
+from .cache import solution_cache
+from .history import negotiation_history
+from .prefetch import prefetcher
+from .quotes import QUOTE_MEDIA_TYPES, quote_extractor, quote_sessions, split_document, to_candidates
+from .thumbnails import THUMBNAILS_ENABLED, THUMBNAIL_CACHE_CONTROL, thumbnail_store, validators, is_not_modified
+from .idempotency import idempotency_store, request_fingerprint, IDEMPOTENCY_HEADER, REPLAYED_HEADER
+from .responses import ModelResponse, CompressionMiddleware
+from .logs import configure_logging, shutdown_logging, log
+from .ratelimit import RATE_LIMIT_ENABLED, RateLimitMiddleware
+from .metrics import REGISTRY, MetricsMiddleware, stage_timer
+from .tracing import TracingMiddleware, add_event, current_trace_id, shutdown_tracing, span
+from .profiling import ProfilingMiddleware, profiling_enabled, check_token, profile_path, render_profile_text
+
+# (.env is loaded once in app/__init__.py)
+
+logger = logging.getLogger(__name__)
+
+# Import slow vendor SDKs in the background after startup instead of on the cold-start path
+PRELOAD_CLIENTS = os.getenv("PRELOAD_CLIENTS", "1") != "0"
+PRELOAD_MODULES = ("openai", "gtts", "app.negotiation_service")
+
+# Cap on names per POST /product/images call (a page of candidates is well below this)
+IMAGE_BATCH_MAX_NAMES = int(os.getenv("IMAGE_BATCH_MAX_NAMES", "500"))
+
+_negotiation_service = None
+
+
+def get_negotiation_service():
+    """
+    Shared NegotiationService (one HTTP connection pool), imported and built on first use
+    so `requests` stays off the import path of a cold start.
+    """
+    global _negotiation_service
+    if _negotiation_service is None:
+        from .negotiation_service import NegotiationService
+        _negotiation_service = NegotiationService()
+    return _negotiation_service
+
+
+def _preload_clients():
+    for module in PRELOAD_MODULES:
+        importlib.import_module(module)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Structured logs go through a queue to a background thread; see app/logs.py
+    configure_logging()
+    if PRELOAD_CLIENTS:
+        asyncio.get_running_loop().run_in_executor(None, _preload_clients)
+    yield
+    await prefetcher.shutdown()
+    solver_executor.shutdown()
+    negotiation_history.close()
+    shutdown_tracing()
+    shutdown_logging()
 
-# Load env variables (OPENAI_API_KEY)
-load_dotenv()
 
 app = FastAPI(
     title="Office Procurement AI (Co-Pilot)",
     description="An API for a human-in-the-loop procurement process.",
     version="2.0.0",
+    lifespan=lifespan,
 )
 
+# Per-client admission control; inside CORS so browsers can read the 429s
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -35,16 +113,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Negotiated gzip/brotli for large JSON bodies (candidate maps, base64 audio)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(TracingMiddleware)
+# Opt-in per-request profiling; not installed at all unless PROFILING_TOKEN is set
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+# Outermost, so latency includes compression and CORS handling
+app.add_middleware(MetricsMiddleware)
+
 
 # --- Request Models for new endpoints ---
 class SearchRequest(BaseModel):
     detected_items: List[DetectedItem]
     preferences: UserPreferences
     budget: float
+    max_delivery_days: Optional[int] = Field(None, ge=0)  # Hard deadline: slower candidates are never selected
+    listing: Optional[CandidateListingOptions] = None
+    use_negotiated_prices: bool = True  # Pre-apply the best price previously negotiated with each vendor
+    split_sourcing: bool = False  # Allow an item's quantity to be split across several candidates
+    prefetch: bool = False  # Warm product images and vendor ids in the background after the search
+    session_id: Optional[str] = None  # Groups prefetch work and uploaded quotes (see /procure/quotes)
+
+
+class SiteRequest(BaseModel):
+    site_id: str
+    detected_items: List[DetectedItem]
+    budget_cap: Optional[float] = None  # Most this site may spend out of the shared budget
+    fixed_items: Dict[str, str] = {}
+
+
+class BatchSearchRequest(BaseModel):
+    sites: List[SiteRequest]
+    preferences: UserPreferences
+    budget: float  # Shared by all sites
+    max_delivery_days: Optional[int] = Field(None, ge=0)  # Applies to every site
+    use_negotiated_prices: bool = True
+
+
+class ProductImagesRequest(BaseModel):
+    names: List[str] = Field(..., max_length=IMAGE_BATCH_MAX_NAMES)
 
 
 class NegotiationStartRequest(BaseModel):
     candidate_name: str
+    item_name: Optional[str] = None  # Lets the history store index negotiated prices by product
 
 
 class NegotiationMessageRequest(BaseModel):
@@ -52,6 +165,21 @@ class NegotiationMessageRequest(BaseModel):
     message_content: str
 
 
+def log_step(logs: List[str], message: str):
+    # Keeps the user-facing `logs` and the request's trace events in step
+    logs.append(message)
+    add_event(message)
+
+
+def flag_selected(candidates_map: Dict[str, List[MarketCandidate]], solution: Solution):
+    # With split sourcing every candidate that supplies some units counts as selected
+    for item_name, selected_candidate in solution.selections.items():
+        chosen = set((solution.allocations or {}).get(item_name, {})) or {selected_candidate.name}
+        for candidate in candidates_map.get(item_name, []):
+            if candidate.name in chosen:
+                candidate.is_selected = True
+
+
 # --- Helper for Mock Data ---
 def generate_mock_candidates(items: List[DetectedItem]) -> Dict[str, List[MarketCandidate]]:
     # Mock Scraper logic
@@ -84,18 +212,104 @@ def generate_mock_candidates(items: List[DetectedItem]) -> Dict[str, List[Market
     return candidates_map
 
 
+def build_search_response(
+        candidates_map: Dict[str, List[MarketCandidate]],
+        solution: Optional[Solution],
+        logs: List[str],
+        preferences: UserPreferences,
+        listing: Optional[CandidateListingOptions],
+) -> ModelResponse:
+    # Trim and sparsify the candidate listing only after selections are flagged
+    if listing is None:
+        return ModelResponse(SearchResponse(
+            all_candidates=candidates_map,
+            initial_solution=solution,
+            logs=logs,
+            trace_id=current_trace_id(),
+        ))
+
+    response = SearchResponse(
+        all_candidates=apply_listing_options(candidates_map, preferences, listing),
+        initial_solution=solution,
+        logs=logs,
+        candidate_totals={item_name: len(candidates) for item_name, candidates in candidates_map.items()},
+        trace_id=current_trace_id(),
+    )
+    return ModelResponse(response, exclude=listing_field_exclusions(listing))
+
+
+def _negotiated_prices(candidates_map: Dict[str, List[MarketCandidate]]) -> Dict[str, Dict[str, float]]:
+    return {
+        item_name: negotiation_history.best_prices((c.name for c in candidates), item_name=item_name)
+        for item_name, candidates in candidates_map.items()
+    }
+
+
+async def apply_negotiated_prices(candidates_map: Dict[str, List[MarketCandidate]], logs: List[str]):
+    # Reuse earlier negotiations so users don't start from list price with a known vendor
+    # SQLite queries block, so they run in a worker thread
+    prices_by_item = await asyncio.to_thread(_negotiated_prices, candidates_map)
+    for item_name, candidates in candidates_map.items():
+        best_prices = prices_by_item[item_name]
+        for candidate in candidates:
+            negotiated = best_prices.get(candidate.name)
+            if negotiated is not None and negotiated < candidate.price:
+                log_step(logs, f"Applied previously negotiated price for {candidate.name}: ${candidate.price:.2f} -> ${negotiated:.2f}")
+                candidate.price = negotiated
+
+
 # --- API Endpoints ---
 
+def thumbnail_url(request: Request, product_name: str) -> str:
+    return str(request.url_for("get_product_thumbnail").include_query_params(name=normalize_product_name(product_name)))
+
+
 @app.get("/product/image")
-async def get_product_image(name: str):
+async def get_product_image(name: str, request: Request):
     """
     Finds an image URL for a given product name using DuckDuckGo Search.
     Uses in-memory caching to prevent rate limits.
+    With the thumbnail store enabled, the URL points at our own `/product/thumbnail`.
     """
+    if THUMBNAILS_ENABLED:
+        return {"image_url": thumbnail_url(request, name)}
     image_url = find_product_image(name)
     return {"image_url": image_url}
 
 
+@app.post("/product/images")
+async def get_product_images(request: ProductImagesRequest, http_request: Request):
+    """
+    Image URLs for many product names in one round-trip (e.g. every candidate in a
+    SearchResponse). Names are deduplicated after normalization and share the cache
+    with `GET /product/image`.
+    """
+    if THUMBNAILS_ENABLED:
+        return {"images": {name: thumbnail_url(http_request, name) for name in request.names}}
+    return {"images": find_product_images(request.names)}
+
+
+@app.get("/product/thumbnail")
+async def get_product_thumbnail(
+        name: str,
+        if_none_match: Optional[str] = Header(None),
+        if_modified_since: Optional[str] = Header(None),
+):
+    """
+    Serves the locally stored thumbnail for a product, fetching and resizing it on first use.
+    Responses carry ETag/Last-Modified and a long Cache-Control; a matching conditional
+    request gets 304 without a body.
+    """
+    if not THUMBNAILS_ENABLED:
+        raise HTTPException(status_code=404, detail="The thumbnail store is not enabled.")
+    path, media_type = await thumbnail_store.get(name)
+    etag, last_modified = validators(path)
+    headers = {"ETag": etag, "Last-Modified": last_modified, "Cache-Control": THUMBNAIL_CACHE_CONTROL}
+    if is_not_modified(path, if_none_match, if_modified_since):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
 @app.post("/upload-image/", response_model=ImageAnalysisResponse)
 async def upload_image(image: UploadFile = File(...), message: Optional[str] = Form(None)):
     """
@@ -110,75 +324,303 @@ async def upload_image(image: UploadFile = File(...), message: Optional[str] = F
     return analysis_result
 
 
+def merge_quote_candidates(
+        market_candidates: Dict[str, List[MarketCandidate]],
+        detected_items: List[DetectedItem],
+        session_id: str,
+        logs: List[str],
+):
+    """
+    Adds the session's uploaded quote lines as candidates for the items they quote.
+    Copies are added, so flagging a search's selection never touches the stored quotes.
+    """
+    quoted = quote_sessions.candidates_for(session_id)
+    if not quoted:
+        return
+    added = 0
+    for item in detected_items:
+        for candidate in quoted.get(normalize_product_name(item.name), []):
+            market_candidates.setdefault(item.name, []).append(candidate.model_copy())
+            added += 1
+    if added:
+        log_step(logs, f"Added {added} candidates from uploaded quotes for session {session_id}.")
+
+
+@app.post("/procure/quotes", response_model=QuoteIngestionResponse)
+async def ingest_quote(
+        file: UploadFile = File(...),
+        session_id: str = Form(...),
+        vendor_name: Optional[str] = Form(None),
+        item_name: Optional[str] = Form(None),
+):
+    """
+    Reads a supplier quote (PDF or image) into candidates for a search session. Pages are
+    extracted in parallel and cached by content, so re-uploading a revised quote only
+    re-reads the pages that changed. The candidates join the generated ones in every
+    `/procure/search` sent with the same `session_id`.
+    """
+    if file.content_type not in QUOTE_MEDIA_TYPES:
+        raise HTTPException(status_code=415, detail=f"Unsupported file type. Upload one of: {', '.join(QUOTE_MEDIA_TYPES)}.")
+    data = await file.read()
+    document = file.filename or "quote"
+
+    with stage_timer("quote_split"):
+        pages = await asyncio.to_thread(split_document, data, file.content_type)
+    if not pages:
+        raise HTTPException(status_code=422, detail="The document has no readable pages.")
+
+    with span("quote.extract", pages=len(pages)):
+        line_items, extracted_vendor, pages_reused, failed_pages = await quote_extractor.extract(pages)
+    vendor_name = vendor_name or extracted_vendor
+    candidates = to_candidates(line_items, vendor_name, document, item_name)
+    quote_sessions.put(session_id, document, candidates)
+
+    return ModelResponse(QuoteIngestionResponse(
+        session_id=session_id,
+        document=document,
+        vendor_name=vendor_name,
+        pages=len(pages),
+        pages_reused=pages_reused,
+        failed_pages=failed_pages,
+        line_items=line_items,
+        added_candidates=candidates,
+    ))
+
+
 @app.post("/procure/search", response_model=SearchResponse)
 async def search_procurement_options(request: SearchRequest):
     """
     Step 1: Generates candidates, finds an initial optimal solution,
     and returns ALL candidates with the winners flagged.
     """
-    logs = ["Starting procurement search..."]
+    logs: List[str] = []
+    log_step(logs, "Starting procurement search...")
 
     # 1. Generate mock candidates
-    market_candidates = generate_mock_candidates(request.detected_items)
-    logs.append(f"Generated {sum(len(v) for v in market_candidates.values())} market candidates for {len(request.detected_items)} item types.")
-
-    # 2. Run the optimizer to find the initial best setup
-    optimizer = ProcurementOptimizer()
-    initial_solution = optimizer.find_constrained_optimal_setup(
+    with stage_timer("candidate_generation"):
+        market_candidates = generate_mock_candidates(request.detected_items)
+    log_step(logs, f"Generated {sum(len(v) for v in market_candidates.values())} market candidates for {len(request.detected_items)} item types.")
+    if request.session_id:
+        merge_quote_candidates(market_candidates, request.detected_items, request.session_id, logs)
+    if request.use_negotiated_prices:
+        await apply_negotiated_prices(market_candidates, logs)
+
+    # 2. Run the optimizer to find the initial best setup (offloaded if the search space is large)
+    solve = solver_executor.solve_split if request.split_sourcing else solver_executor.solve
+    initial_solution = await solve(
         detected_items=request.detected_items,
         candidates_map=market_candidates,
         preferences=request.preferences,
         max_total_budget=request.budget,
+        max_delivery_days=request.max_delivery_days,
     )
-    logs.append("Initial optimization complete.")
+    log_step(logs, "Initial optimization complete.")
 
     # 3. Flag the selected candidates
     if initial_solution:
-        logs.append(f"Initial solution found with total cost: ${initial_solution.total_cost:.2f}")
-        for item_name, selected_candidate in initial_solution.selections.items():
-            for candidate in market_candidates.get(item_name, []):
-                if candidate.name == selected_candidate.name:
-                    candidate.is_selected = True
-                    break
+        log_step(logs, f"Initial solution found with total cost: ${initial_solution.total_cost:.2f}")
+        flag_selected(market_candidates, initial_solution)
+        if request.prefetch:
+            session_id = request.session_id or current_trace_id()
+            prefetcher.schedule(session_id, market_candidates, request.preferences, get_negotiation_service)
+            log_step(logs, f"Background prefetch started for session {session_id}.")
     else:
-        logs.append("No solution found within the given budget.")
+        log_step(logs, "No solution found within the given budget.")
 
-    return SearchResponse(
+    return build_search_response(market_candidates, initial_solution, logs, request.preferences, request.listing)
+
+
+@app.post("/procure/batch-search", response_model=BatchSearchResponse)
+async def batch_search_procurement_options(request: BatchSearchRequest):
+    """
+    Furnishes several sites at once under one company budget (plus optional per-site caps).
+    Candidates are generated once per item name and shared by every site that needs it,
+    and the sites are optimized jointly rather than with a hand-split budget each.
+    """
+    logs: List[str] = []
+    log_step(logs, f"Starting batch procurement search for {len(request.sites)} sites...")
+
+    site_ids = [site.site_id for site in request.sites]
+    if len(set(site_ids)) != len(site_ids):
+        raise HTTPException(status_code=422, detail="site_id must be unique within a batch.")
+
+    # 1. One candidate list per distinct item name across all sites
+    unique_items: Dict[str, DetectedItem] = {}
+    for site in request.sites:
+        for item in site.detected_items:
+            unique_items.setdefault(item.name, item)
+    with stage_timer("candidate_generation"):
+        market_candidates = generate_mock_candidates(list(unique_items.values()))
+    log_step(logs, f"Generated {sum(len(v) for v in market_candidates.values())} market candidates for {len(unique_items)} distinct item types.")
+    if request.use_negotiated_prices:
+        await apply_negotiated_prices(market_candidates, logs)
+
+    # 2. Joint optimization over the shared budget
+    solutions = await solver_executor.solve_batch(
+        sites=[(site.detected_items, site.budget_cap, site.fixed_items) for site in request.sites],
+        candidates_map=market_candidates,
+        preferences=request.preferences,
+        max_total_budget=request.budget,
+        max_delivery_days=request.max_delivery_days,
+    )
+    log_step(logs, "Batch optimization complete.")
+
+    # 3. Flag every candidate picked by at least one site
+    site_solutions: Optional[List[SiteSolution]] = None
+    total_cost = 0.0
+    if solutions is not None:
+        site_solutions = [SiteSolution(site_id=site_id, solution=solution) for site_id, solution in zip(site_ids, solutions)]
+        total_cost = sum(solution.total_cost for solution in solutions)
+        for solution in solutions:
+            for selected_candidate in solution.selections.values():
+                selected_candidate.is_selected = True
+        log_step(logs, f"Batch solution found with total cost: ${total_cost:.2f}")
+    else:
+        log_step(logs, "No batch solution fits the shared budget and site caps.")
+
+    return ModelResponse(BatchSearchResponse(
         all_candidates=market_candidates,
-        initial_solution=initial_solution,
+        site_solutions=site_solutions,
+        total_cost=total_cost,
         logs=logs,
-    )
+        trace_id=current_trace_id(),
+    ))
+
+
+@app.delete("/procure/sessions/{session_id}/prefetch")
+async def cancel_prefetch(session_id: str):
+    """
+    Cancels background prefetching for a session (e.g. when the user leaves the page).
+    """
+    return {"cancelled": prefetcher.cancel(session_id)}
 
 
 @app.post("/negotiate/start", response_model=Dict[str, int])
-async def start_negotiation(request: NegotiationStartRequest):
+async def start_negotiation(
+        request: NegotiationStartRequest,
+        response: Response,
+        http_request: Request,
+        idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+):
     """
     Step 2a: Starts a negotiation conversation for a specific candidate.
+    A retried request with the same `Idempotency-Key` returns the original conversation.
     """
-    negotiator = NegotiationService()
-    conversation_id = negotiator.start_conversation(request.candidate_name)
-    if not conversation_id:
-        raise HTTPException(status_code=500, detail="Failed to start conversation with vendor API.")
-    return {"conversation_id": conversation_id}
+    async def start() -> Dict[str, int]:
+        negotiator = get_negotiation_service()
+        # Blocking NegBot calls run in a worker thread so a slow upstream can't stall the event loop
+        conversation_id = await asyncio.to_thread(negotiator.start_conversation, request.candidate_name)
+        if not conversation_id:
+            raise HTTPException(status_code=500, detail="Failed to start conversation with vendor API.")
+        await asyncio.to_thread(
+            negotiation_history.record_conversation, conversation_id, request.candidate_name, request.item_name,
+        )
+        return {"conversation_id": conversation_id}
+
+    result, replayed = await idempotency_store.run(
+        http_request.scope, idempotency_key, request_fingerprint(request), start,
+    )
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return result
 
 
 @app.post("/negotiate/message", response_model=NegotiationResponse)
-async def message_negotiation(request: NegotiationMessageRequest):
+async def message_negotiation(
+        request: NegotiationMessageRequest,
+        http_request: Request,
+        idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+):
     """
     Step 2b: Sends a message in a negotiation and gets the vendor's audio/text reply.
+    A retried request with the same `Idempotency-Key` returns the original reply without re-sending it.
     """
-    negotiator = NegotiationService()
-    response = negotiator.send_message(request.conversation_id, request.message_content)
-    if not response:
-        raise HTTPException(status_code=500, detail="Failed to get response from vendor API.")
-
-    text_reply, audio_base64, parsed_price = response
-    return NegotiationResponse(
-        text_response=text_reply,
-        audio_base64=audio_base64,
-        conversation_id=request.conversation_id,
-        parsed_new_price=parsed_price,
+    async def send() -> NegotiationResponse:
+        negotiator = get_negotiation_service()
+        reply = await asyncio.to_thread(negotiator.send_message, request.conversation_id, request.message_content)
+        if not reply:
+            raise HTTPException(status_code=500, detail="Failed to get response from vendor API.")
+
+        text_reply, audio_base64, parsed_price = reply
+        await asyncio.to_thread(
+            negotiation_history.record_exchange, request.conversation_id, request.message_content, text_reply, parsed_price,
+        )
+        return NegotiationResponse(
+            text_response=text_reply,
+            audio_base64=audio_base64,
+            conversation_id=request.conversation_id,
+            parsed_new_price=parsed_price,
+        )
+
+    result, replayed = await idempotency_store.run(
+        http_request.scope, idempotency_key, request_fingerprint(request), send,
     )
+    return ModelResponse(result, headers={REPLAYED_HEADER: "true"} if replayed else None)
+
+
+@app.websocket("/negotiate/ws/{conversation_id}")
+async def negotiation_channel(websocket: WebSocket, conversation_id: int):
+    """
+    Step 2b (streaming): one persistent connection per conversation.
+    Client sends `{"message_content": "..."}`; for each turn the server pushes
+    `{"type": "text", ...}` as soon as NegBot replies, then the MP3 audio as
+    binary frames while it is synthesized, then `{"type": "audio_end", "chunks": n}`.
+    """
+    from .negotiation_service import stream_tts_audio
+
+    await websocket.accept()
+    negotiator = get_negotiation_service()
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            try:
+                # Binary frames carry no "text"; they and malformed JSON shouldn't end the conversation
+                payload = json.loads(frame.get("text") or "")
+            except ValueError:
+                await websocket.send_json({"type": "error", "detail": "Messages must be JSON text frames."})
+                continue
+            message = payload.get("message_content") if isinstance(payload, dict) else None
+            if not message:
+                await websocket.send_json({"type": "error", "detail": "message_content is required."})
+                continue
+
+            with span("negotiate.ws.turn", conversation_id=conversation_id):
+                # NegBot and gTTS clients are blocking, so keep them off the event loop
+                reply = await asyncio.to_thread(negotiator.fetch_reply, conversation_id, message)
+                if reply is None:
+                    await websocket.send_json({"type": "error", "detail": "Failed to get response from vendor API."})
+                    continue
+
+                text_reply, parsed_price = reply
+                await asyncio.to_thread(
+                    negotiation_history.record_exchange, conversation_id, message, text_reply, parsed_price,
+                )
+                await websocket.send_json({
+                    "type": "text",
+                    "conversation_id": conversation_id,
+                    "text_response": text_reply,
+                    "parsed_new_price": parsed_price,
+                })
+
+                chunks = 0
+                audio = stream_tts_audio(text_reply)
+                try:
+                    with stage_timer("tts"):
+                        while True:
+                            chunk = await asyncio.to_thread(next, audio, None)
+                            if chunk is None:
+                                break
+                            await websocket.send_bytes(chunk)
+                            chunks += 1
+                except Exception as e:
+                    log(logger, logging.ERROR, "TTS streaming failed", error=str(e), conversation_id=conversation_id)
+                    await websocket.send_json({"type": "audio_error", "detail": "Audio synthesis failed."})
+                    continue
+                await websocket.send_json({"type": "audio_end", "chunks": chunks})
+    except WebSocketDisconnect:
+        return
 
 
 @app.post("/procure/recalculate", response_model=SearchResponse)
@@ -186,36 +628,85 @@ async def recalculate_procurement(request: RecalculateRequest):
     """
     Step 3: Re-runs the optimizer with updated prices and fixed items.
     """
-    logs = ["Re-calculating optimal solution with new constraints..."]
+    logs: List[str] = []
+    log_step(logs, "Re-calculating optimal solution with new constraints...")
 
-    optimizer = ProcurementOptimizer()
-    new_solution = optimizer.find_constrained_optimal_setup(
+    solve = solver_executor.solve_split if request.split_sourcing else solver_executor.solve
+    new_solution = await solve(
         detected_items=request.detected_items,
         candidates_map=request.candidates_map,
         preferences=request.preferences,
         max_total_budget=request.budget,
         fixed_items=request.fixed_items,
+        max_delivery_days=request.max_delivery_days,
     )
-    logs.append("Re-optimization complete.")
+    log_step(logs, "Re-optimization complete.")
 
     # Flag the new selections
     if new_solution:
-        logs.append(f"New solution found with total cost: ${new_solution.total_cost:.2f}")
+        log_step(logs, f"New solution found with total cost: ${new_solution.total_cost:.2f}")
         # First, reset all `is_selected` flags
         for category in request.candidates_map.values():
             for cand in category:
                 cand.is_selected = False
         # Then, set the new ones
-        for item_name, selected_candidate in new_solution.selections.items():
-            for candidate in request.candidates_map.get(item_name, []):
-                if candidate.name == selected_candidate.name:
-                    candidate.is_selected = True
-                    break
+        flag_selected(request.candidates_map, new_solution)
     else:
-        logs.append("No new solution could be found with the updated constraints.")
+        log_step(logs, "No new solution could be found with the updated constraints.")
 
-    return SearchResponse(
-        all_candidates=request.candidates_map,
-        initial_solution=new_solution,
-        logs=logs,
-    )
\ No newline at end of file
+    return build_search_response(request.candidates_map, new_solution, logs, request.preferences, request.listing)
+
+
+@app.post("/procure/sensitivity", response_model=SensitivityResponse)
+async def price_sensitivity(request: SensitivityRequest):
+    """
+    Negotiation targets: the price at which each non-selected candidate would enter
+    the optimal solution, and how much headroom each selected candidate has.
+    """
+    analysis = await solver_executor.price_sensitivity(
+        detected_items=request.detected_items,
+        candidates_map=request.candidates_map,
+        preferences=request.preferences,
+        max_total_budget=request.budget,
+        fixed_items=request.fixed_items,
+        max_delivery_days=request.max_delivery_days,
+    )
+    if analysis is None:
+        raise HTTPException(status_code=422, detail="No solution fits the budget and fixed items, so there is nothing to analyze.")
+    candidates, budget_resolution = analysis
+    return ModelResponse(SensitivityResponse(candidates=candidates, budget_resolution=budget_resolution))
+
+
+@app.get("/optimizer/cache/stats")
+async def get_optimizer_cache_stats():
+    """
+    Hit/miss/eviction counters for the optimizer result cache.
+    """
+    return solution_cache.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus text exposition of request, stage, optimizer and cache metrics.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/profiles/{profile_id}")
+async def download_profile(
+        profile_id: str,
+        format: str = "prof",
+        x_profile_token: Optional[str] = Header(None),
+):
+    """
+    Downloads a captured request profile (`.prof` for snakeviz/pstats, or `format=text`).
+    """
+    if not check_token(x_profile_token):
+        raise HTTPException(status_code=404, detail="Not found.")
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    if format == "text":
+        return PlainTextResponse(render_profile_text(path))
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
@@ -18,6 +18,11 @@ class ImageAnalysisResponse(BaseModel):
     detected_items: List[DetectedItem]  # <--- Added this to pass data to frontend
 
 
+class PriceTier(BaseModel):
+    min_quantity: int = Field(..., ge=1)
+    unit_price: float = Field(..., ge=0.0)
+
+
 class MarketCandidate(BaseModel):
     name: str
     price: float
@@ -25,6 +30,32 @@ class MarketCandidate(BaseModel):
     quality_score: float
     url: str
     is_selected: bool = False
+    price_tiers: Optional[List[PriceTier]] = None  # Volume discounts: from `min_quantity` units, every unit costs `unit_price`
+    stock: Optional[int] = Field(None, ge=0)  # Units the vendor can supply (None = unlimited)
+    min_order_quantity: int = Field(1, ge=1)
+
+    def unit_price(self, quantity: int) -> float:
+        """
+        Per-unit price when ordering `quantity` units: the highest tier reached, or the flat
+        `price` when no tier applies (or when `price` has been negotiated below the tier).
+        """
+        unit_price = self.price
+        if self.price_tiers:
+            reached = [tier for tier in self.price_tiers if tier.min_quantity <= quantity]
+            if reached:
+                unit_price = min(unit_price, max(reached, key=lambda tier: tier.min_quantity).unit_price)
+        return unit_price
+
+    def cost(self, quantity: int) -> float:
+        return self.unit_price(quantity) * quantity
+
+    def can_supply(self, quantity: int, max_delivery_days: Optional[int] = None) -> bool:
+        """
+        Whether this candidate alone can take an order of `quantity` units in time.
+        """
+        if max_delivery_days is not None and self.delivery_days > max_delivery_days:
+            return False
+        return self.min_order_quantity <= quantity and (self.stock is None or self.stock >= quantity)
 
 
 class UserPreferences(BaseModel):
@@ -41,9 +72,10 @@ class UserPreferences(BaseModel):
 
 
 class Solution(BaseModel):
-    selections: Dict[str, MarketCandidate]
+    selections: Dict[str, MarketCandidate]  # With split sourcing: the candidate supplying most of each item
     total_cost: float
     max_delivery_days: int
+    allocations: Optional[Dict[str, Dict[str, int]]] = None  # Split sourcing only: item -> candidate name -> units
 
 
 class FinalReport(BaseModel):
@@ -63,15 +95,103 @@ class NegotiationResponse(BaseModel):
     parsed_new_price: Optional[float] = None
 
 
+class CandidateListingOptions(BaseModel):
+    """
+    Controls how much of `all_candidates` is sent back. Candidates are ranked by
+    score per item; selected ones are always included.
+    """
+    top_n: Optional[int] = Field(None, ge=1)
+    offset: int = Field(0, ge=0)
+    fields: Optional[List[str]] = None
+
+    @model_validator(mode='after')
+    def check_fields(self) -> 'CandidateListingOptions':
+        if self.fields is not None:
+            unknown = set(self.fields) - set(MarketCandidate.model_fields)
+            if unknown:
+                raise ValueError(f"Unknown candidate fields: {', '.join(sorted(unknown))}")
+        return self
+
+
 class RecalculateRequest(BaseModel):
     detected_items: List[DetectedItem]
     candidates_map: Dict[str, List[MarketCandidate]]
     preferences: UserPreferences
     budget: float
     fixed_items: Dict[str, str]
+    listing: Optional[CandidateListingOptions] = None
+    max_delivery_days: Optional[int] = Field(None, ge=0)  # Hard deadline: slower candidates are never selected
+    split_sourcing: bool = False  # Allow an item's quantity to be split across several candidates
+
+
+class SensitivityRequest(BaseModel):
+    detected_items: List[DetectedItem]
+    candidates_map: Dict[str, List[MarketCandidate]]
+    preferences: UserPreferences
+    budget: float
+    fixed_items: Dict[str, str] = {}
+    max_delivery_days: Optional[int] = Field(None, ge=0)
+
+
+class CandidateSensitivity(BaseModel):
+    """
+    For a non-selected candidate, `threshold_price` is the highest price at which it
+    would enter the optimal solution (None if no price would do it) and `headroom` is
+    the discount needed to get there. For a selected candidate, `threshold_price` is
+    the highest price at which it stays selected and `headroom` is how far its price
+    can rise before that. Prices are per unit at the item's quantity (tier discounts
+    applied); candidates that can't take the order (deadline, stock, minimum order)
+    get no threshold.
+    """
+    item_name: str
+    candidate_name: str
+    current_price: float
+    is_selected: bool
+    threshold_price: Optional[float] = None
+    headroom: Optional[float] = None
+
+
+class SensitivityResponse(BaseModel):
+    candidates: List[CandidateSensitivity]
+    budget_resolution: float  # Costs are rounded up to this step, so thresholds are accurate to about one step
 
 
 class SearchResponse(BaseModel):
     all_candidates: Dict[str, List[MarketCandidate]]
     initial_solution: Optional[Solution]
-    logs: List[str]
\ No newline at end of file
+    logs: List[str]
+    candidate_totals: Optional[Dict[str, int]] = None  # Set when the listing was trimmed
+    trace_id: Optional[str] = None  # Same id as the `X-Trace-Id` header; each log line is also a span event
+
+
+class SiteSolution(BaseModel):
+    site_id: str
+    solution: Solution
+
+
+class BatchSearchResponse(BaseModel):
+    all_candidates: Dict[str, List[MarketCandidate]]  # Shared by every site; `is_selected` is set if any site picked it
+    site_solutions: Optional[List[SiteSolution]]  # None when the sites can't all be furnished within the budgets
+    total_cost: float
+    logs: List[str]
+    trace_id: Optional[str] = None
+
+
+class QuoteLineItem(BaseModel):
+    item_name: str  # Generic item type the line is for, e.g. "Office Chair"
+    product_name: str  # As written on the quote
+    unit_price: float
+    delivery_days: Optional[int] = None
+    quality_score: Optional[float] = None
+    page: int
+
+
+class QuoteIngestionResponse(BaseModel):
+    session_id: str
+    document: str
+    vendor_name: Optional[str]
+    pages: int
+    pages_reused: int  # Pages whose extraction came from the cache (unchanged since an earlier upload)
+    failed_pages: List[int]
+    line_items: List[QuoteLineItem]
+    added_candidates: Dict[str, List[MarketCandidate]]  # Merged into `/procure/search` for this session_id
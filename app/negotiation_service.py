@@ -1,11 +1,13 @@
+import os
 import re
 import time
 import base64
+import logging
+import threading
 from io import BytesIO
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 import requests
-from gtts import gTTS
 
 from .models import (
     DetectedItem,
@@ -14,28 +16,79 @@ from .models import (
     Solution,
 )
 from .services import ProcurementOptimizer
+from .metrics import stage_timer
+from .tracing import span, propagation_headers
+from .outbound import CallPolicy, CircuitOpenError, breaker, call_with_policy
+from .logs import log
+
+logger = logging.getLogger(__name__)
 
 # --- Configuration for the Partner API ---
-NEGBOT_API_BASE = "https://negbot-backend-ajdxh9axb0ddb0e9.westeurope-01.azurewebsites.net/api"
-TEAM_ID = "641754"
+# Both can be overridden, e.g. to point at the local stand-in in `loadtest/standins.py`
+NEGBOT_API_BASE = os.getenv(
+    "NEGBOT_API_BASE",
+    "https://negbot-backend-ajdxh9axb0ddb0e9.westeurope-01.azurewebsites.net/api",
+)
+TEAM_ID = os.getenv("NEGBOT_TEAM_ID", "641754")
+# Pause before each negotiation call (basic rate limiting towards NegBot)
+NEGBOT_REQUEST_DELAY = float(os.getenv("NEGBOT_REQUEST_DELAY", "1"))
+# Per-attempt timeouts in seconds; message replies are LLM-generated and slower
+NEGBOT_TIMEOUT = float(os.getenv("NEGBOT_TIMEOUT", "10"))
+NEGBOT_MESSAGE_TIMEOUT = float(os.getenv("NEGBOT_MESSAGE_TIMEOUT", "45"))
+NEGBOT_RETRIES = int(os.getenv("NEGBOT_RETRIES", "2"))
+NEGBOT_HEDGE_AFTER = float(os.getenv("NEGBOT_HEDGE_AFTER", "1.5"))
+
+# Only the read-only vendor listing is retried and hedged; creates and messages are not idempotent
+NEGBOT_POLICIES = {
+    "list_vendors": CallPolicy(timeout=NEGBOT_TIMEOUT, retries=NEGBOT_RETRIES, hedge_after=NEGBOT_HEDGE_AFTER),
+    "create_vendor": CallPolicy(timeout=NEGBOT_TIMEOUT),
+    "create_conversation": CallPolicy(timeout=NEGBOT_TIMEOUT),
+    "send_message": CallPolicy(timeout=NEGBOT_MESSAGE_TIMEOUT),
+}
+negbot_breaker = breaker("negbot")
+
+# Set to 0 to skip gTTS (it always calls Google, which load tests should not hammer)
+TTS_ENABLED = os.getenv("TTS_ENABLED", "1") != "0"
 
 
 def generate_tts_audio(text: str) -> str:
     """
     Converts text to speech using gTTS and returns it as a Base64 encoded string.
     """
+    if not TTS_ENABLED:
+        return ""
     try:
-        tts = gTTS(text=text, lang='en')
-        audio_fp = BytesIO()
-        tts.write_to_fp(audio_fp)
+        from gtts import gTTS  # Deferred: only needed once a negotiation reply arrives
+        with stage_timer("tts"), span("tts.synthesize", characters=len(text)):
+            tts = gTTS(text=text, lang='en')
+            audio_fp = BytesIO()
+            tts.write_to_fp(audio_fp)
         audio_fp.seek(0)
         audio_bytes = audio_fp.read()
         return base64.b64encode(audio_bytes).decode('utf-8')
     except Exception as e:
-        print(f"Error generating TTS audio: {e}")
+        log(logger, logging.ERROR, "TTS generation failed", error=str(e), characters=len(text))
         return ""
 
 
+def stream_tts_audio(text: str) -> Iterator[bytes]:
+    """
+    Yields MP3 segments as gTTS synthesizes each part of the text, so the first
+    audio can be sent before the whole reply is converted.
+    """
+    if not TTS_ENABLED:
+        return
+    from gtts import gTTS  # Deferred: only needed once a negotiation reply arrives
+    yield from gTTS(text=text, lang='en').stream()
+
+
+def _is_negbot_failure(response: Optional[requests.Response], error: Optional[BaseException]) -> bool:
+    # Network errors, timeouts, throttling and 5xx count against NegBot; other 4xx are our fault
+    if error is not None:
+        return isinstance(error, (requests.ConnectionError, requests.Timeout))
+    return response.status_code == 429 or response.status_code >= 500
+
+
 class NegotiationService:
     """
     Manages the interactive negotiation process with the NegBot API.
@@ -44,15 +97,66 @@ class NegotiationService:
     def __init__(self):
         self.session = requests.Session()
         self.team_params = {"team_id": TEAM_ID}
+        # vendor name -> NegBot vendor id, filled from listings and creations
+        self._vendor_ids: Dict[str, int] = {}
+        self._vendor_lock = threading.Lock()
+
+    def _call(self, operation: str, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Single choke point for NegBot HTTP calls: timed, traced, tagged with `traceparent`
+        and run under the operation's timeout/retry/hedging policy and the NegBot circuit breaker.
+        """
+        with stage_timer("negbot"), span(f"negbot.{operation}", http_method=method, path=path) as call_span:
+            headers = propagation_headers()
+
+            def send(timeout: float) -> requests.Response:
+                return self.session.request(
+                    method,
+                    f"{NEGBOT_API_BASE}{path}",
+                    params=self.team_params,
+                    headers=headers,
+                    timeout=timeout,
+                    **kwargs,
+                )
+
+            try:
+                response = call_with_policy(
+                    send,
+                    NEGBOT_POLICIES[operation],
+                    circuit=negbot_breaker,
+                    is_failure=_is_negbot_failure,
+                    upstream="negbot",
+                )
+            except CircuitOpenError as e:
+                # Surface through the existing `requests.RequestException` error paths
+                raise requests.ConnectionError(str(e)) from e
+            call_span.set_attribute("http.status_code", response.status_code)
+            return response
+
+    def _refresh_vendor_ids(self):
+        response = self._call("list_vendors", "GET", "/vendors/")
+        response.raise_for_status()
+        listed: Dict[str, int] = {}
+        for vendor in response.json():
+            if vendor.get("name") and vendor["name"] not in listed:
+                listed[vendor["name"]] = vendor["id"]
+        with self._vendor_lock:
+            self._vendor_ids.update(listed)
+
+    def _cached_vendor_id(self, vendor_name: str) -> Optional[int]:
+        with self._vendor_lock:
+            return self._vendor_ids.get(vendor_name)
 
     def _get_or_create_vendor(self, vendor_name: str) -> Optional[int]:
+        cached = self._cached_vendor_id(vendor_name)
+        if cached:
+            return cached
         try:
             # 1. Check if exists
-            response = self.session.get(f"{NEGBOT_API_BASE}/vendors/", params=self.team_params)
-            response.raise_for_status()
-            for vendor in response.json():
-                if vendor.get("name") == vendor_name:
-                    return vendor["id"]
+            self._refresh_vendor_ids()
+            cached = self._cached_vendor_id(vendor_name)
+            if cached:
+                return cached
 
             # 2. Create if not exists (WITH REQUIRED FIELDS)
             new_vendor_payload = {
@@ -65,19 +169,35 @@ class NegotiationService:
                 )
             }
 
-            response = self.session.post(
-                f"{NEGBOT_API_BASE}/vendors/",
-                params=self.team_params,
-                json=new_vendor_payload,
-            )
+            response = self._call("create_vendor", "POST", "/vendors/", json=new_vendor_payload)
             response.raise_for_status()
-            return response.json()["id"]
+            vendor_id = response.json()["id"]
+            with self._vendor_lock:
+                self._vendor_ids[vendor_name] = vendor_id
+            return vendor_id
         except requests.RequestException as e:
-            print(f"API Error in _get_or_create_vendor: {e}")
-            if e.response is not None:
-                print(f"Server Response: {e.response.text}")
+            log(
+                logger, logging.ERROR, "NegBot vendor lookup failed",
+                error=str(e), vendor=vendor_name,
+                status=e.response.status_code if e.response is not None else None,
+                response=e.response.text if e.response is not None else None,
+            )
             return None
 
+    def warm_vendor_ids(self, create_for: Iterable[str] = ()):
+        """
+        Loads every known vendor id with one listing call, then creates vendors for
+        `create_for` (the candidates a user is about to negotiate with) ahead of time.
+        """
+        try:
+            self._refresh_vendor_ids()
+        except requests.RequestException as e:
+            log(logger, logging.WARNING, "NegBot vendor warm-up failed", error=str(e))
+            return
+        for vendor_name in create_for:
+            if not self._cached_vendor_id(vendor_name):
+                self._get_or_create_vendor(vendor_name)
+
     def _extract_price_from_text(self, text: str) -> Optional[float]:
         """
         Uses regex to find a dollar amount in a string.
@@ -110,43 +230,49 @@ class NegotiationService:
         """
         Creates a vendor if needed and starts a new conversation.
         """
-        time.sleep(1)  # Basic rate limiting
+        time.sleep(NEGBOT_REQUEST_DELAY)  # Basic rate limiting
         vendor_id = self._get_or_create_vendor(candidate_name)
         if not vendor_id:
-            print(f"Failed to get vendor ID for {candidate_name}")
+            log(logger, logging.WARNING, "No NegBot vendor id, conversation not started", candidate=candidate_name)
             return None
 
         try:
-            response = self.session.post(
-                f"{NEGBOT_API_BASE}/conversations/",
-                params=self.team_params,
+            response = self._call(
+                "create_conversation",
+                "POST",
+                "/conversations/",
                 json={"vendor_id": vendor_id, "title": f"Price Negotiation for {candidate_name}"},
             )
             response.raise_for_status()
             return response.json()["id"]
         except requests.RequestException as e:
-            print(f"API Error in start_conversation: {e}")
+            log(logger, logging.ERROR, "NegBot conversation start failed", error=str(e), candidate=candidate_name)
             return None
 
-    def send_message(self, conversation_id: int, message: str) -> Optional[Tuple[str, str, Optional[float]]]:
+    def fetch_reply(self, conversation_id: int, message: str) -> Optional[Tuple[str, Optional[float]]]:
         """
-        Sends a message to a conversation and gets the vendor's reply.
+        Sends a message to a conversation and returns the vendor's text reply and parsed price,
+        without synthesizing audio.
         """
-        time.sleep(1)  # Basic rate limiting
+        time.sleep(NEGBOT_REQUEST_DELAY)  # Basic rate limiting
         try:
-            response = self.session.post(
-                f"{NEGBOT_API_BASE}/messages/{conversation_id}",
-                params=self.team_params,
-                data={"content": message},
-            )
+            response = self._call("send_message", "POST", f"/messages/{conversation_id}", data={"content": message})
             response.raise_for_status()
             bot_reply_text = response.json()["content"]
+            return bot_reply_text, self._extract_price_from_text(bot_reply_text)
+        except requests.RequestException as e:
+            log(logger, logging.ERROR, "NegBot message failed", error=str(e), conversation_id=conversation_id)
+            return None
 
-            # Generate TTS and parse for price
-            audio_base64 = generate_tts_audio(bot_reply_text)
-            parsed_price = self._extract_price_from_text(bot_reply_text)
+    def send_message(self, conversation_id: int, message: str) -> Optional[Tuple[str, str, Optional[float]]]:
+        """
+        Sends a message to a conversation and gets the vendor's reply.
+        """
+        reply = self.fetch_reply(conversation_id, message)
+        if reply is None:
+            return None
+        bot_reply_text, parsed_price = reply
 
-            return bot_reply_text, audio_base64, parsed_price
-        except requests.RequestException as e:
-            print(f"API Error in send_message: {e}")
-            return None
\ No newline at end of file
+        # Generate TTS for the reply
+        audio_base64 = generate_tts_audio(bot_reply_text)
+        return bot_reply_text, audio_base64, parsed_price
\ No newline at end of file
@@ -0,0 +1,216 @@
+import os
+import time
+import random
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Callable, List, Optional, TypeVar
+
+from .metrics import REGISTRY, Counter
+
+T = TypeVar("T")
+
+# --- Outbound Call Policy Configuration ---
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+HEDGE_POOL_SIZE = int(os.getenv("HEDGE_POOL_SIZE", "8"))
+
+OUTBOUND_EVENTS = REGISTRY.register(Counter(
+    "outbound_events_total",
+    "Outbound call policy events by upstream and event (retry, hedge, failure, circuit_open).",
+))
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream whose circuit breaker is open.
+    """
+
+
+class CallPolicy:
+    """
+    How a single kind of outbound call is made.
+
+    timeout:      per-attempt timeout in seconds
+    retries:      extra attempts after the first; only used for idempotent calls
+    backoff_base: first retry waits up to this many seconds (full jitter, doubling per attempt)
+    backoff_max:  cap on any single backoff
+    hedge_after:  for read-only calls, send a second identical request if the first
+                  hasn't answered after this many seconds (None disables hedging)
+    """
+
+    def __init__(
+            self,
+            timeout: float,
+            retries: int = 0,
+            backoff_base: float = 0.2,
+            backoff_max: float = 2.0,
+            hedge_after: Optional[float] = None,
+    ):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails fast for `reset_seconds`,
+    then lets a single trial call through (half-open) before closing again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    def check(self):
+        if not self.allow():
+            OUTBOUND_EVENTS.inc(upstream=self.name, event="circuit_open")
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open), failing fast.")
+
+
+_breakers: List[CircuitBreaker] = []
+
+
+def breaker(name: str) -> CircuitBreaker:
+    new_breaker = CircuitBreaker(name)
+    _breakers.append(new_breaker)
+    return new_breaker
+
+
+def _render_breaker_states() -> List[str]:
+    lines = [
+        "# HELP circuit_breaker_open 1 if the upstream's circuit breaker is open or half-open.",
+        "# TYPE circuit_breaker_open gauge",
+    ]
+    for b in _breakers:
+        lines.append(f'circuit_breaker_open{{upstream="{b.name}"}} {0 if b.state == "closed" else 1}')
+    return lines
+
+
+REGISTRY.add_collector(_render_breaker_states)
+
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+_hedge_pool_lock = threading.Lock()
+
+
+def _get_hedge_pool() -> ThreadPoolExecutor:
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _hedge_pool_lock:
+            if _hedge_pool is None:
+                _hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_POOL_SIZE, thread_name_prefix="hedge")
+    return _hedge_pool
+
+
+def _hedged(send: Callable[[float], T], policy: CallPolicy, upstream: str) -> T:
+    pool = _get_hedge_pool()
+    # Copy the context so trace spans/headers survive the hop to the pool thread
+    first: Future = pool.submit(contextvars.copy_context().run, send, policy.timeout)
+    done, _ = wait([first], timeout=policy.hedge_after)
+    if done:
+        return first.result()
+
+    OUTBOUND_EVENTS.inc(upstream=upstream, event="hedge")
+    second: Future = pool.submit(contextvars.copy_context().run, send, policy.timeout)
+    pending = {first, second}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def call_with_policy(
+        send: Callable[[float], T],
+        policy: CallPolicy,
+        circuit: Optional[CircuitBreaker] = None,
+        is_failure: Callable[[Optional[T], Optional[BaseException]], bool] = lambda result, error: error is not None,
+        upstream: str = "upstream",
+) -> T:
+    """
+    Runs `send(timeout)` under `policy`: fail fast if the circuit is open, hedge read-only
+    calls, and retry failures with jittered backoff. `is_failure` decides whether an
+    outcome (a result or an exception) counts as a failure worth retrying/tripping on.
+    The last result is returned, or the last exception re-raised.
+    """
+    attempt = 0
+    while True:
+        if circuit is not None:
+            circuit.check()
+
+        result: Optional[T] = None
+        error: Optional[BaseException] = None
+        try:
+            if policy.hedge_after is not None:
+                result = _hedged(send, policy, upstream)
+            else:
+                result = send(policy.timeout)
+        except Exception as e:
+            error = e
+
+        if not is_failure(result, error):
+            if circuit is not None:
+                circuit.record_success()
+            if error is not None:
+                raise error
+            return result
+
+        OUTBOUND_EVENTS.inc(upstream=upstream, event="failure")
+        if circuit is not None:
+            circuit.record_failure()
+        if attempt >= policy.retries:
+            if error is not None:
+                raise error
+            return result
+
+        OUTBOUND_EVENTS.inc(upstream=upstream, event="retry")
+        time.sleep(policy.backoff(attempt))
+        attempt += 1
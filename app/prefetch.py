@@ -0,0 +1,91 @@
+import os
+import logging
+import asyncio
+from typing import Callable, Dict, List, Optional
+
+from .models import MarketCandidate, UserPreferences
+from .services import ProcurementOptimizer, find_product_image
+from .metrics import stage_timer
+from .thumbnails import THUMBNAILS_ENABLED, thumbnail_store
+from .logs import log
+
+logger = logging.getLogger(__name__)
+
+# --- Prefetch Configuration ---
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", "2"))  # best non-selected candidates per item to warm
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "4"))  # prefetch jobs running at once, all sessions
+
+
+class Prefetcher:
+    """
+    After a search, warms what the user is about to ask for: product images (and local
+    thumbnails, when enabled) for the selected and top-ranked candidates, and NegBot
+    vendor ids (creating vendors only for the selected candidates). Jobs share one
+    concurrency budget, at most one job runs per session, and a session's job can be
+    cancelled when the session ends.
+    """
+
+    def __init__(self, top_n: int = PREFETCH_TOP_N, concurrency: int = PREFETCH_CONCURRENCY):
+        self.top_n = top_n
+        self.concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def schedule(
+            self,
+            session_id: str,
+            candidates_map: Dict[str, List[MarketCandidate]],
+            preferences: UserPreferences,
+            get_negotiator: Callable,
+    ) -> asyncio.Task:
+        # A newer search supersedes whatever was still warming for this session
+        self.cancel(session_id)
+
+        selected = [c.name for candidates in candidates_map.values() for c in candidates if c.is_selected]
+        ranked: List[str] = []
+        for candidates in candidates_map.values():
+            scores = ProcurementOptimizer.score_candidates(candidates, preferences)
+            others = sorted((c for c in candidates if not c.is_selected), key=lambda c: scores[c.name], reverse=True)
+            ranked.extend(c.name for c in others[:self.top_n])
+
+        task = asyncio.create_task(self._run(selected, ranked, get_negotiator))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda done: self._forget(session_id, done))
+        return task
+
+    def cancel(self, session_id: str) -> bool:
+        task = self._tasks.pop(session_id, None)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    async def shutdown(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _forget(self, session_id: str, task: asyncio.Task):
+        if self._tasks.get(session_id) is task:
+            del self._tasks[session_id]
+        if not task.cancelled() and task.exception() is not None:
+            log(logger, logging.WARNING, "Prefetch failed", session_id=session_id, error=str(task.exception()))
+
+    async def _run(self, selected: List[str], ranked: List[str], get_negotiator: Callable):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            with stage_timer("prefetch"):
+                for name in selected + ranked:
+                    find_product_image(name)
+                if THUMBNAILS_ENABLED:
+                    # Failures are left for the page's own request to report
+                    await asyncio.gather(*(thumbnail_store.get(name) for name in selected + ranked), return_exceptions=True)
+                negotiator = get_negotiator()
+                # Blocking HTTP; a cancelled task stops waiting but the running call finishes in its thread
+                await asyncio.to_thread(negotiator.warm_vendor_ids, selected)
+
+
+prefetcher = Prefetcher()
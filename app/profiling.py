@@ -0,0 +1,114 @@
+import os
+import io
+import hmac
+import glob
+import pstats
+import secrets
+import cProfile
+import contextvars
+from typing import Optional
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# --- Profiling Configuration ---
+# Profiling is off unless a token is configured; requests must present it in `X-Profile-Token`.
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_TOKEN_HEADER = b"x-profile-token"
+
+# Set while a profiled request runs so the optimizer solves inline, where cProfile can see `solve()`
+profiling_active: contextvars.ContextVar[bool] = contextvars.ContextVar("profiling_active", default=False)
+# cProfile hooks the whole event-loop thread, so only one profile can record at a time
+_profile_running = False
+
+
+def profiling_enabled() -> bool:
+    return bool(PROFILING_TOKEN)
+
+
+def check_token(token: Optional[str]) -> bool:
+    return profiling_enabled() and token is not None and hmac.compare_digest(token, PROFILING_TOKEN)
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    if not profile_id.isalnum():
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.prof")
+    return path if os.path.exists(path) else None
+
+
+def render_profile_text(path: str, limit: int = 60) -> str:
+    out = io.StringIO()
+    stats = pstats.Stats(path, stream=out)
+    stats.sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+def _prune_old_profiles():
+    files = sorted(glob.glob(os.path.join(PROFILE_DIR, "*.prof")), key=os.path.getmtime)
+    for stale in files[:-PROFILE_MAX_FILES]:
+        try:
+            os.remove(stale)
+        except OSError:
+            pass
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a single request with cProfile when it carries `X-Profile: 1` (or `?profile=1`)
+    and a valid `X-Profile-Token`. The profile id is returned in `X-Profile-Id` and can be
+    downloaded from `/debug/profiles/{id}`. Only installed when PROFILING_TOKEN is set.
+
+    The profiler records the event-loop thread, so whatever else runs on the loop while the
+    request awaits (other requests, background tasks) shows up in its profile too; profile
+    on an otherwise idle instance. One profile records at a time; a second profiled request
+    meanwhile gets 409.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        global _profile_running
+        if _profile_running:
+            response = JSONResponse({"detail": "Another request is being profiled; retry when it finishes."}, status_code=409)
+            await response(scope, receive, send)
+            return
+        _profile_running = True
+
+        profile_id = secrets.token_hex(8)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode("latin-1"))]
+            await send(message)
+
+        profiler = cProfile.Profile()
+        token = profiling_active.set(True)
+        try:
+            profiler.enable()
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.disable()
+            _profile_running = False
+            profiling_active.reset(token)
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{profile_id}.prof"))
+            _prune_old_profiles()
+
+    @staticmethod
+    def _requested(scope: Scope) -> bool:
+        headers = dict(scope.get("headers", []))
+        flagged = headers.get(PROFILE_HEADER) == b"1" or b"profile=1" in scope.get("query_string", b"").split(b"&")
+        if not flagged:
+            return False
+        token = headers.get(PROFILE_TOKEN_HEADER)
+        return check_token(token.decode("latin-1") if token is not None else None)
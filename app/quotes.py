@@ -0,0 +1,287 @@
+import os
+import io
+import json
+import logging
+import time
+import base64
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .models import MarketCandidate, QuoteLineItem
+from .services import (
+    OPENAI_POLICY,
+    openai_breaker,
+    _is_openai_failure,
+    get_openai_client,
+    normalize_product_name,
+)
+from .cache import MISSING, SolutionCache
+from .metrics import stage_timer
+from .tracing import span
+from .outbound import CircuitOpenError, call_with_policy
+from .logs import log
+
+logger = logging.getLogger(__name__)
+
+# --- Quote Ingestion Configuration ---
+QUOTE_PAGE_CONCURRENCY = int(os.getenv("QUOTE_PAGE_CONCURRENCY", "4"))  # Pages extracted at once, all uploads
+QUOTE_MAX_PAGES = int(os.getenv("QUOTE_MAX_PAGES", "50"))
+QUOTE_PAGE_CACHE_SIZE = int(os.getenv("QUOTE_PAGE_CACHE_SIZE", "2048"))
+QUOTE_SESSION_TTL_SECONDS = float(os.getenv("QUOTE_SESSION_TTL_SECONDS", "86400"))
+QUOTE_MAX_SESSIONS = int(os.getenv("QUOTE_MAX_SESSIONS", "10000"))
+# Quotes rarely state these; candidates get neutral values so they can still be ranked
+QUOTE_DEFAULT_DELIVERY_DAYS = int(os.getenv("QUOTE_DEFAULT_DELIVERY_DAYS", "14"))
+QUOTE_DEFAULT_QUALITY = float(os.getenv("QUOTE_DEFAULT_QUALITY", "0.5"))
+
+# Part of every page cache key: bump it when the prompt changes so cached pages are re-extracted
+EXTRACTION_VERSION = "1"
+
+QUOTE_MEDIA_TYPES = ("application/pdf", "image/jpeg", "image/png", "image/webp")
+IMAGE_EXTENSIONS = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
+
+EXTRACTION_PROMPT = (
+    "You extract line items from one page of a supplier quote or price list. "
+    "Return a JSON object with keys 'vendor' (the supplier's name, or null if not on this page) "
+    "and 'lines', a list of quoted products. Each line must have: "
+    "'item' (string, generic item type like 'Office Chair' or 'Hammer'), "
+    "'product' (string, the product as written on the quote), "
+    "'unit_price' (number, price per unit without currency symbols), "
+    "'delivery_days' (integer or null) and 'quality_score' (0.0-1.0 if the quote states a grade, else null). "
+    "Skip subtotals, taxes, shipping and discount lines. Return an empty list if the page quotes no products."
+)
+
+page_cache = SolutionCache(QUOTE_PAGE_CACHE_SIZE, name="quote_page")
+
+
+class QuotePage:
+    """
+    One page of an uploaded quote: its text when the page has any, otherwise its largest image.
+    """
+
+    def __init__(self, number: int, text: Optional[str] = None, image: Optional[bytes] = None, media_type: str = ""):
+        self.number = number
+        self.text = text
+        self.image = image
+        self.media_type = media_type
+
+    @property
+    def cache_key(self) -> str:
+        payload = self.text.encode("utf-8") if self.text is not None else self.image
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{EXTRACTION_VERSION}|{self.media_type}|".encode("utf-8"))
+        digest.update(payload)
+        return digest.hexdigest()
+
+
+def split_document(data: bytes, content_type: str) -> List[QuotePage]:
+    """
+    Splits an upload into pages. PDFs need the optional `pypdf` package; scanned pages
+    without a text layer fall back to the page's largest embedded image.
+    """
+    if content_type.startswith("image/"):
+        return [QuotePage(1, image=data, media_type=content_type)]
+
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise HTTPException(status_code=415, detail="PDF quotes need the 'pypdf' package on the server.")
+    try:
+        reader = PdfReader(io.BytesIO(data))
+        if len(reader.pages) > QUOTE_MAX_PAGES:
+            raise HTTPException(status_code=413, detail=f"Quotes are limited to {QUOTE_MAX_PAGES} pages.")
+        pages: List[QuotePage] = []
+        for number, page in enumerate(reader.pages, start=1):
+            text = (page.extract_text() or "").strip()
+            if text:
+                pages.append(QuotePage(number, text=text, media_type="text/plain"))
+                continue
+            images = [
+                image for image in page.images
+                if os.path.splitext(image.name)[1].lower() in IMAGE_EXTENSIONS
+            ]
+            if images:
+                largest = max(images, key=lambda image: len(image.data))
+                media_type = IMAGE_EXTENSIONS[os.path.splitext(largest.name)[1].lower()]
+                pages.append(QuotePage(number, image=largest.data, media_type=media_type))
+        return pages
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read the PDF: {e}")
+
+
+def _extract_page(page: QuotePage) -> Dict:
+    """
+    Blocking OpenAI call for one page; returns the parsed JSON object.
+    """
+    if page.text is not None:
+        content = [{"type": "text", "text": page.text}]
+    else:
+        encoded = base64.b64encode(page.image).decode("utf-8")
+        content = [
+            {"type": "text", "text": "Extract the quoted products from this page."},
+            {"type": "image_url", "image_url": {"url": f"data:{page.media_type};base64,{encoded}"}},
+        ]
+    messages = [
+        {"role": "system", "content": EXTRACTION_PROMPT},
+        {"role": "user", "content": content},
+    ]
+
+    def send(timeout: float):
+        return get_openai_client().chat.completions.create(
+            model="gpt-4o",
+            messages=messages,
+            response_format={"type": "json_object"},
+            timeout=timeout,
+        )
+
+    response = call_with_policy(send, OPENAI_POLICY, openai_breaker, _is_openai_failure, "openai")
+    return json.loads(response.choices[0].message.content)
+
+
+def _parse_lines(extracted: Dict, page_number: int) -> List[QuoteLineItem]:
+    lines: List[QuoteLineItem] = []
+    for line in extracted.get("lines") or []:
+        try:
+            lines.append(QuoteLineItem(
+                item_name=line.get("item") or line["product"],
+                product_name=line.get("product") or line["item"],
+                unit_price=float(line["unit_price"]),
+                delivery_days=line.get("delivery_days"),
+                quality_score=line.get("quality_score"),
+                page=page_number,
+            ))
+        except (KeyError, TypeError, ValueError):
+            continue  # A line without a usable name or price can't become a candidate
+    return lines
+
+
+class QuoteExtractor:
+    """
+    Extracts every page of a quote in parallel. Pages share one concurrency budget across
+    uploads, and each page's result is cached by its content, so re-uploading a revised
+    quote only sends the changed pages to OpenAI.
+    """
+
+    def __init__(self, concurrency: int = QUOTE_PAGE_CONCURRENCY):
+        self.concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def _page(self, page: QuotePage) -> Tuple[Optional[Dict], bool]:
+        """
+        Returns `(extracted, reused)`; `extracted` is None if the page failed.
+        """
+        key = page.cache_key
+        cached = page_cache.get(key)
+        if cached is not MISSING:
+            return cached, True
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            with stage_timer("quote_page"), span("quote.page", page=page.number, kind=page.media_type):
+                try:
+                    extracted = await asyncio.to_thread(_extract_page, page)
+                except CircuitOpenError:
+                    raise
+                except Exception as e:
+                    log(logger, logging.WARNING, "Quote page extraction failed", page=page.number, error=str(e))
+                    return None, False
+        page_cache.put(key, extracted)
+        return extracted, False
+
+    async def extract(self, pages: List[QuotePage]) -> Tuple[List[QuoteLineItem], Optional[str], int, List[int]]:
+        """
+        Returns `(line_items, vendor_name, pages_reused, failed_pages)`.
+        """
+        try:
+            results = await asyncio.gather(*(self._page(page) for page in pages))
+        except CircuitOpenError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(openai_breaker.reset_seconds))})
+
+        line_items: List[QuoteLineItem] = []
+        vendor_name: Optional[str] = None
+        failed_pages: List[int] = []
+        reused = 0
+        for page, (extracted, from_cache) in zip(pages, results):
+            if extracted is None:
+                failed_pages.append(page.number)
+                continue
+            reused += from_cache
+            vendor_name = vendor_name or extracted.get("vendor")
+            line_items.extend(_parse_lines(extracted, page.number))
+        return line_items, vendor_name, reused, failed_pages
+
+
+def to_candidates(
+        line_items: List[QuoteLineItem],
+        vendor_name: Optional[str],
+        document: str,
+        item_name: Optional[str] = None,
+) -> Dict[str, List[MarketCandidate]]:
+    """
+    Groups quote lines into candidates per item. `item_name` files every line under one
+    item instead of the item type read from the quote.
+    """
+    candidates: Dict[str, List[MarketCandidate]] = {}
+    for line in line_items:
+        name = f"{line.product_name} ({vendor_name})" if vendor_name else line.product_name
+        candidates.setdefault(item_name or line.item_name, []).append(MarketCandidate(
+            name=name,
+            price=line.unit_price,
+            delivery_days=line.delivery_days if line.delivery_days is not None else QUOTE_DEFAULT_DELIVERY_DAYS,
+            quality_score=line.quality_score if line.quality_score is not None else QUOTE_DEFAULT_QUALITY,
+            url=f"quote://{document}#page={line.page}",
+        ))
+    return candidates
+
+
+class QuoteSessions:
+    """
+    Candidates ingested from quotes, per search session and per document. Uploading a
+    document again (e.g. a revised quote) replaces that document's candidates.
+    Sessions expire after a TTL; the oldest are dropped beyond `max_sessions`.
+    """
+
+    def __init__(self, ttl_seconds: float = QUOTE_SESSION_TTL_SECONDS, max_sessions: int = QUOTE_MAX_SESSIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        # session_id -> (expires_at, {document: {item_name: [candidates]}})
+        self._sessions: "OrderedDict[str, Tuple[float, Dict[str, Dict[str, List[MarketCandidate]]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        for session_id, (expires_at, _) in list(self._sessions.items()):
+            if expires_at > now and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+    def put(self, session_id: str, document: str, candidates: Dict[str, List[MarketCandidate]]):
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            _, documents = self._sessions.pop(session_id, (0.0, {}))
+            documents[document] = candidates
+            self._sessions[session_id] = (now + self.ttl_seconds, documents)
+
+    def candidates_for(self, session_id: str) -> Dict[str, List[MarketCandidate]]:
+        """
+        All of a session's quote candidates, keyed by normalized item name.
+        """
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[0] <= time.monotonic():
+                return {}
+            merged: Dict[str, List[MarketCandidate]] = {}
+            for candidates in entry[1].values():
+                for item_name, item_candidates in candidates.items():
+                    merged.setdefault(normalize_product_name(item_name), []).extend(item_candidates)
+            return merged
+
+
+quote_extractor = QuoteExtractor()
+quote_sessions = QuoteSessions()
@@ -0,0 +1,324 @@
+import os
+import math
+import logging
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import REGISTRY, Counter
+from .logs import log
+
+logger = logging.getLogger(__name__)
+
+
+class Limit:
+    """
+    Admission limits for one endpoint class, per client.
+
+    rate:        sustained requests per second (token refill rate); 0 disables rate limiting
+    burst:       bucket size, i.e. requests a quiet client may send at once
+    concurrency: requests a client may have in flight at once, per worker; 0 disables the quota
+    """
+
+    def __init__(self, rate: float, burst: int, concurrency: int):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+
+
+def _limit(endpoint_class: str, rate: str, burst: str, concurrency: str) -> Limit:
+    prefix = f"RATE_LIMIT_{endpoint_class.upper()}"
+    return Limit(
+        rate=float(os.getenv(f"{prefix}_RATE", rate)),
+        burst=int(os.getenv(f"{prefix}_BURST", burst)),
+        concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", concurrency)),
+    )
+
+
+# --- Rate Limit Configuration ---
+# Off by default: turn it on where the API is exposed to clients we don't control
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "0") == "1"
+# Empty keeps buckets in this worker's memory; "redis://..." shares them between workers and hosts
+RATE_LIMIT_BACKEND_URL = os.getenv("RATE_LIMIT_BACKEND_URL", "")
+# Over-limit requests wait up to this long for a token or a free slot before getting a 429
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "2"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "100000"))  # In-memory buckets kept
+# Behind a proxy, identify clients by the first X-Forwarded-For address instead of the peer address
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "0") == "1"
+
+# Keys (comma-separated) that get their own buckets; any other X-API-Key is ignored, so a client
+# can't dodge its limits by sending a fresh key with every request
+RATE_LIMIT_API_KEYS = frozenset(key.strip() for key in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if key.strip())
+
+API_KEY_HEADER = b"x-api-key"
+
+# Endpoint class per path prefix; the first match wins, anything else is "default"
+ENDPOINT_CLASSES = (
+    ("/upload-image/", "openai"),
+    ("/procure/quotes", "openai"),
+    ("/negotiate/", "negbot"),
+    ("/procure/sessions/", "default"),
+    ("/procure/", "solver"),
+)
+EXEMPT_PREFIXES = ("/metrics", "/debug/")
+
+LIMITS: Dict[str, Limit] = {
+    # Each call spends our OpenAI quota
+    "openai": _limit("openai", rate="0.5", burst="10", concurrency="4"),
+    # Each call holds a NegBot conversation (and TTS) for seconds
+    "negbot": _limit("negbot", rate="2", burst="20", concurrency="4"),
+    "solver": _limit("solver", rate="10", burst="50", concurrency="8"),
+    "default": _limit("default", rate="50", burst="200", concurrency="64"),
+}
+
+RATE_LIMIT_DECISIONS = REGISTRY.register(Counter(
+    "rate_limit_decisions_total",
+    "Admission decisions by endpoint class and outcome (allowed, queued, rejected, backend_error).",
+))
+
+
+class MemoryBackend:
+    """
+    Token buckets in this worker's memory. With several workers each one enforces the
+    limits on its own, so a client gets up to `workers` times the configured rate.
+    """
+
+    def __init__(self, max_entries: int = RATE_LIMIT_MAX_CLIENTS):
+        self.max_entries = max_entries
+        # bucket key -> (tokens, updated_at); least recently used first
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def reserve(self, key: str, rate: float, burst: int, max_wait: float) -> Tuple[bool, float]:
+        """
+        Takes a token for `key`. Returns `(True, delay)` with the time to wait before the
+        token is due (0 if one was available), or `(False, retry_after)` if that wait
+        would exceed `max_wait`; a rejected request takes nothing.
+        """
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(key, (float(burst), now))
+        tokens = min(float(burst), tokens + (now - updated_at) * rate) - 1.0
+        delay = -tokens / rate if tokens < 0 else 0.0
+        allowed = delay <= max_wait
+        self._buckets[key] = (tokens if allowed else tokens + 1.0, now)
+        if len(self._buckets) > self.max_entries:
+            self._buckets.popitem(last=False)  # A forgotten bucket just starts full again
+        return allowed, delay
+
+
+# Same algorithm as MemoryBackend, run atomically in Redis on the server's clock
+_REDIS_RESERVE = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local rate, burst, max_wait = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or burst
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - updated_at) * rate) - 1
+local delay = 0
+if tokens < 0 then delay = -tokens / rate end
+local allowed = 1
+if delay > max_wait then
+    allowed = 0
+    tokens = tokens + 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate + max_wait) + 1)
+return {allowed, tostring(delay)}
+"""
+
+
+class RedisBackend:
+    """
+    Token buckets in Redis, shared by every worker and host that points at the same
+    server. Needs the optional `redis` package.
+    """
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        from redis import asyncio as redis_asyncio
+
+        self.prefix = prefix
+        self._client = redis_asyncio.from_url(url)
+        self._script = self._client.register_script(_REDIS_RESERVE)
+
+    async def reserve(self, key: str, rate: float, burst: int, max_wait: float) -> Tuple[bool, float]:
+        allowed, delay = await self._script(keys=[self.prefix + key], args=[rate, burst, max_wait])
+        return bool(allowed), float(delay)
+
+
+def backend_from_url(url: str):
+    if not url:
+        return MemoryBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported RATE_LIMIT_BACKEND_URL: {url}")
+
+
+class ConcurrencyQuota:
+    """
+    In-flight request slots per key, in this worker. Waiters queue in arrival order;
+    a key's semaphore is dropped as soon as nobody holds or waits for it.
+    """
+
+    def __init__(self):
+        # key -> (semaphore, holders + waiters)
+        self._slots: Dict[str, list] = {}
+
+    async def acquire(self, key: str, limit: int, max_wait: float) -> bool:
+        slots = self._slots.get(key)
+        if slots is None:
+            slots = self._slots[key] = [asyncio.Semaphore(limit), 0]
+        slots[1] += 1
+        semaphore = slots[0]
+        try:
+            if semaphore.locked():
+                if max_wait <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait_for(semaphore.acquire(), timeout=max_wait)
+            else:
+                await semaphore.acquire()
+            return True
+        except BaseException as e:
+            self._leave(key, slots)
+            if isinstance(e, asyncio.TimeoutError):
+                return False
+            raise
+
+    def release(self, key: str):
+        slots = self._slots[key]
+        slots[0].release()
+        self._leave(key, slots)
+
+    def _leave(self, key: str, slots: list):
+        slots[1] -= 1
+        if slots[1] == 0:
+            del self._slots[key]
+
+
+def endpoint_class(path: str) -> Optional[str]:
+    """
+    The endpoint class whose limits apply to `path`, or None if the path is exempt.
+    """
+    if path.startswith(EXEMPT_PREFIXES):
+        return None
+    for prefix, name in ENDPOINT_CLASSES:
+        if path.startswith(prefix):
+            return name
+    return "default"
+
+
+def client_id(scope: Scope) -> str:
+    """
+    The API key when the client sends one listed in `RATE_LIMIT_API_KEYS` (hashed, so keys
+    never sit in memory or Redis), otherwise the client's address.
+    """
+    headers = dict(scope.get("headers", []))
+    api_key = headers.get(API_KEY_HEADER)
+    if api_key and api_key.decode("latin-1") in RATE_LIMIT_API_KEYS:
+        return "key:" + hashlib.blake2b(api_key, digest_size=12).hexdigest()
+    forwarded = headers.get(b"x-forwarded-for")
+    if RATE_LIMIT_TRUST_FORWARDED and forwarded:
+        return "ip:" + forwarded.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+class RateLimitMiddleware:
+    """
+    Admission control per client and endpoint class: a token bucket caps each client's
+    request rate (shared across workers with a Redis backend) and a per-worker quota caps
+    its requests in flight. A request over either limit waits briefly for capacity and is
+    otherwise turned away with 429 and `Retry-After`, before any upstream work starts.
+    A WebSocket handshake takes a token like a request but no in-flight slot, since a
+    negotiation socket stays open for the whole conversation; instead each message on it
+    takes a token, and a client sending too fast is disconnected.
+    Any object with an async `reserve(key, rate, burst, max_wait)` can be passed as `backend`.
+    """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            backend=None,
+            limits: Optional[Dict[str, Limit]] = None,
+            max_wait: float = RATE_LIMIT_MAX_WAIT_SECONDS,
+    ):
+        self.app = app
+        self.backend = backend if backend is not None else backend_from_url(RATE_LIMIT_BACKEND_URL)
+        self.limits = limits if limits is not None else LIMITS
+        self.max_wait = max_wait
+        self.quota = ConcurrencyQuota()
+
+    async def _take_token(self, key: str, name: str, limit: Limit) -> Tuple[bool, float]:
+        if limit.rate <= 0:
+            return True, 0.0
+        try:
+            allowed, delay = await self.backend.reserve(key, limit.rate, limit.burst, self.max_wait)
+        except Exception as e:
+            # A broken shared backend must not take the API down with it: fail open
+            RATE_LIMIT_DECISIONS.inc(endpoint_class=name, outcome="backend_error")
+            log(logger, logging.WARNING, "Rate limit backend failed, admitting request", error=str(e), endpoint_class=name)
+            return True, 0.0
+        if allowed and delay > 0:
+            RATE_LIMIT_DECISIONS.inc(endpoint_class=name, outcome="queued")
+            await asyncio.sleep(delay)
+        return allowed, delay
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        name = endpoint_class(scope["path"]) if scope["type"] in ("http", "websocket") else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.limits.get(name, self.limits["default"])
+        key = f"{client_id(scope)}|{name}"
+        allowed, retry_after = await self._take_token(key, name, limit)
+        if not allowed:
+            await self._reject(scope, receive, send, name, f"Rate limit exceeded for {name} endpoints.", retry_after)
+            return
+
+        if scope["type"] == "websocket":
+            RATE_LIMIT_DECISIONS.inc(endpoint_class=name, outcome="allowed")
+            await self.app(scope, self._metered_receive(receive, send, key, name, limit), send)
+            return
+
+        if limit.concurrency > 0:
+            if not await self.quota.acquire(key, limit.concurrency, self.max_wait):
+                await self._reject(scope, receive, send, name, f"Too many concurrent {name} requests.", 1.0)
+                return
+        RATE_LIMIT_DECISIONS.inc(endpoint_class=name, outcome="allowed")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if limit.concurrency > 0:
+                self.quota.release(key)
+
+    def _metered_receive(self, receive: Receive, send: Send, key: str, name: str, limit: Limit) -> Receive:
+        async def metered() -> Message:
+            message = await receive()
+            if message["type"] == "websocket.receive":
+                allowed, _ = await self._take_token(key, name, limit)
+                if not allowed:
+                    RATE_LIMIT_DECISIONS.inc(endpoint_class=name, outcome="rejected")
+                    await send({"type": "websocket.close", "code": 1013, "reason": "Rate limit exceeded."})
+                    return {"type": "websocket.disconnect", "code": 1013}
+            return message
+
+        return metered
+
+    @staticmethod
+    async def _reject(scope: Scope, receive: Receive, send: Send, name: str, detail: str, retry_after: float):
+        RATE_LIMIT_DECISIONS.inc(endpoint_class=name, outcome="rejected")
+        if scope["type"] == "websocket":
+            # Closing before accept makes the server answer the handshake with 403
+            await send({"type": "websocket.close", "code": 1013})
+            return
+        response = JSONResponse(
+            {"detail": detail},
+            status_code=429,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,140 @@
+import os
+import gzip
+from typing import Optional, Dict, List, Tuple
+
+from pydantic import BaseModel
+from pydantic_core import to_json
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# brotli is optional: without it we only negotiate gzip
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# --- Compression Configuration ---
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+class ModelResponse(Response):
+    """
+    Serializes an already-validated Pydantic model straight to JSON bytes with
+    pydantic-core's Rust encoder. Returning a Response from an endpoint makes
+    FastAPI skip the `response_model` re-validation and the stdlib JSON encoder.
+    """
+    media_type = "application/json"
+
+    def __init__(
+            self,
+            model: BaseModel,
+            status_code: int = 200,
+            headers: Optional[Dict[str, str]] = None,
+            exclude: Optional[dict] = None,
+    ):
+        super().__init__(content=to_json(model, exclude=exclude), status_code=status_code, headers=headers)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Picks the best encoding we support from an Accept-Encoding header.
+    """
+    offered = {}
+    for part in accept_encoding.lower().split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[token.strip()] = q
+
+    if brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """
+    Compresses single-body JSON/text responses above `minimum_size` with brotli
+    or gzip, depending on what the client accepts. Streaming and binary
+    responses pass through untouched.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        passthrough = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start_message, passthrough
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = _header_map(start_message["headers"])
+            if (
+                    message.get("more_body", False)
+                    or len(body) < self.minimum_size
+                    or "content-encoding" in headers
+                    or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            ):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            raw_headers = [
+                (k, v) for k, v in start_message["headers"]
+                if k not in (b"content-length", b"content-encoding")
+            ]
+            raw_headers.append((b"content-encoding", encoding.encode("latin-1")))
+            raw_headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+            if "vary" not in headers:
+                raw_headers.append((b"vary", b"Accept-Encoding"))
+            start_message["headers"] = raw_headers
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def _header_map(raw_headers: List[Tuple[bytes, bytes]]) -> Dict[str, str]:
+    return {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in raw_headers}
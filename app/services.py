@@ -1,11 +1,16 @@
-import base64
+import os
 import json
+import logging
+import math
+import time
+import base64
+import asyncio
+import threading
 import urllib.parse
-from typing import List, Dict, Optional
+from collections import deque
+from typing import List, Dict, Optional, Tuple, TYPE_CHECKING
 
 from fastapi import UploadFile, HTTPException
-from openai import OpenAI
-from dotenv import load_dotenv
 
 from .models import (
     ImageAnalysisResponse,
@@ -13,16 +18,65 @@ from .models import (
     MarketCandidate,
     UserPreferences,
     Solution,
+    CandidateListingOptions,
+    CandidateSensitivity,
 )
-
-# Load env to get OPENAI_API_KEY
-load_dotenv()
-
-# Initialize OpenAI Client
-client = OpenAI()
+from .metrics import stage_timer, CACHE_LOOKUPS
+from .tracing import span
+from .logs import log
+from .outbound import CallPolicy, CircuitOpenError, breaker, call_with_policy
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+logger = logging.getLogger(__name__)
+
+# --- OpenAI Call Policy ---
+# The SDK retries with backoff itself (OPENAI_MAX_RETRIES); we add a per-attempt deadline and a breaker.
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_POLICY = CallPolicy(timeout=OPENAI_TIMEOUT)
+openai_breaker = breaker("openai")
+
+# OpenAI client is created on first use: importing `openai` is slow and
+# constructing it fails outright when OPENAI_API_KEY is missing.
+_client: Optional["OpenAI"] = None
+_client_lock = threading.Lock()
+
+
+def get_openai_client() -> "OpenAI":
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI(timeout=OPENAI_TIMEOUT, max_retries=OPENAI_MAX_RETRIES)
+    return _client
+
+
+def _is_openai_failure(result, error: Optional[BaseException]) -> bool:
+    # Connection errors and timeouts carry no status code; 429 and 5xx are upstream trouble too
+    if error is None:
+        return False
+    status_code = getattr(error, "status_code", None)
+    return status_code is None or status_code == 429 or status_code >= 500
+
+
+# --- Sensitivity Analysis Configuration ---
+# The remaining budget is split into this many steps for the DP tables behind /procure/sensitivity.
+SENSITIVITY_BUDGET_STEPS = int(os.getenv("SENSITIVITY_BUDGET_STEPS", "1000"))
+# Same for the shared budget pool behind /procure/batch-search.
+BATCH_BUDGET_STEPS = int(os.getenv("BATCH_BUDGET_STEPS", "2000"))
+# And for combining items in split-sourcing mode.
+SPLIT_BUDGET_STEPS = int(os.getenv("SPLIT_BUDGET_STEPS", "1000"))
+# Split mode re-checks the exact single-source optimum (a brute-force search) only when it
+# has at most this many candidate combinations; larger searches rely on the budget grid alone.
+SPLIT_EXACT_CHECK_MAX_COMBINATIONS = int(os.getenv("SPLIT_EXACT_CHECK_MAX_COMBINATIONS", "2000"))
 
 # --- Simple In-Memory Cache for Images ---
 IMAGE_CACHE = {}
+# Misses happen once per new product name, i.e. constantly under load: log only this fraction
+IMAGE_MISS_LOG_SAMPLE_RATE = float(os.getenv("IMAGE_MISS_LOG_SAMPLE_RATE", "0.01"))
 
 
 async def analyze_image(image: UploadFile, user_message: Optional[str] = None) -> ImageAnalysisResponse:
@@ -52,27 +106,37 @@ async def analyze_image(image: UploadFile, user_message: Optional[str] = None) -
     if user_message:
         text_prompt = f"What items do we need to buy? User notes: {user_message}"
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": text_prompt},
                 {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": text_prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{image.content_type};base64,{base64_image}"
-                            },
-                        },
-                    ],
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:{image.content_type};base64,{base64_image}"
+                    },
                 },
             ],
+        },
+    ]
+
+    def send(timeout: float):
+        return get_openai_client().chat.completions.create(
+            model="gpt-4o",
+            messages=messages,
             response_format={"type": "json_object"},
+            timeout=timeout,
         )
 
+    try:
+        with stage_timer("openai"), span("openai.chat.completions", model="gpt-4o", image_bytes=len(file_content)):
+            # The SDK call blocks, so run it in a worker thread with a hard per-attempt deadline
+            response = await asyncio.to_thread(
+                call_with_policy, send, OPENAI_POLICY, openai_breaker, _is_openai_failure, "openai",
+            )
+
         content = response.choices[0].message.content
         data = json.loads(content)
 
@@ -95,21 +159,31 @@ async def analyze_image(image: UploadFile, user_message: Optional[str] = None) -
             detected_items=detected_items
         )
 
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(openai_breaker.reset_seconds))})
     except Exception as e:
-        print(f"OpenAI Error: {str(e)}")
+        log(logger, logging.ERROR, "Image analysis failed", error=str(e))
         raise HTTPException(status_code=500, detail=f"Image analysis failed: {str(e)}")
 
 
+def normalize_product_name(product_name: str) -> str:
+    # "Office  Chair" and "office chair" are the same product and share one image
+    return " ".join(product_name.split()).casefold()
+
+
 def find_product_image(product_name: str) -> str:
     """
     Generates a realistic AI image of the product using Pollinations.ai.
     This replaces search engines entirely to ensure 100% uptime and no broken links.
     """
-    # 1. Check Cache
-    if product_name in IMAGE_CACHE:
-        return IMAGE_CACHE[product_name]
+    # 1. Check Cache (spelling variants of a name share one entry; the prompt keeps the name as given)
+    key = normalize_product_name(product_name)
+    if key in IMAGE_CACHE:
+        CACHE_LOOKUPS.inc(cache="product_image", result="hit")
+        return IMAGE_CACHE[key]
+    CACHE_LOOKUPS.inc(cache="product_image", result="miss")
 
-    print(f"Generating AI image for: {product_name}...")
+    log(logger, logging.INFO, "Generating AI image", sample_rate=IMAGE_MISS_LOG_SAMPLE_RATE, product=product_name)
 
     # 2. Construct Prompt for Pollinations
     # We add keywords like "product shot", "white background", "high quality" to make it look like e-commerce.
@@ -117,24 +191,122 @@ def find_product_image(product_name: str) -> str:
     image_url = f"https://image.pollinations.ai/prompt/professional_product_photography_of_{encoded_name}_modern_furniture_white_studio_background_8k?nologo=true"
 
     # 3. Cache and Return
-    IMAGE_CACHE[product_name] = image_url
+    IMAGE_CACHE[key] = image_url
     return image_url
 
 
+def find_product_images(product_names: List[str]) -> Dict[str, str]:
+    """
+    Image URL for every requested name (keyed as given), resolving each distinct
+    normalized name once against the same cache as `find_product_image`.
+    """
+    resolved: Dict[str, str] = {}
+    images: Dict[str, str] = {}
+    for product_name in product_names:
+        key = normalize_product_name(product_name)
+        if key not in resolved:
+            resolved[key] = find_product_image(product_name)
+        images[product_name] = resolved[key]
+    return images
+
+
+def apply_listing_options(
+        candidates_map: Dict[str, List[MarketCandidate]],
+        preferences: UserPreferences,
+        options: CandidateListingOptions,
+) -> Dict[str, List[MarketCandidate]]:
+    """
+    Ranks each item's candidates by score and keeps the `offset`/`top_n` window,
+    always keeping selected candidates so the solution stays visible.
+    """
+    listing: Dict[str, List[MarketCandidate]] = {}
+    for item_name, candidates in candidates_map.items():
+        scores = ProcurementOptimizer.score_candidates(candidates, preferences)
+        ranked = sorted(candidates, key=lambda c: scores[c.name], reverse=True)
+
+        end = options.offset + options.top_n if options.top_n is not None else None
+        window = ranked[options.offset:end]
+        window_ids = {id(c) for c in window}
+        listing[item_name] = [c for c in ranked if id(c) in window_ids or c.is_selected]
+    return listing
+
+
+def listing_field_exclusions(options: Optional[CandidateListingOptions]) -> Optional[dict]:
+    """
+    Builds a serializer `exclude` spec that drops unrequested candidate fields.
+    `name` is always kept since it identifies the candidate.
+    """
+    if options is None or options.fields is None:
+        return None
+    dropped = set(MarketCandidate.model_fields) - set(options.fields) - {"name"}
+    if not dropped:
+        return None
+    return {"all_candidates": {"__all__": {"__all__": dropped}}}
+
+
 class ProcurementOptimizer:
     """
     Handles the logic for finding the best procurement options based on user preferences.
+    After each solve, `stats` holds the nodes explored and the time spent scoring and searching.
     """
 
+    def __init__(self):
+        self.stats = {"nodes_explored": 0, "scoring_seconds": 0.0, "solve_seconds": 0.0}
+
+    @staticmethod
+    def score_candidates(
+            candidates: List[MarketCandidate],
+            preferences: UserPreferences,
+            prices: Optional[List[float]] = None,
+    ) -> Dict[str, float]:
+        """
+        Min-max normalizes price, delivery and quality within one item's candidates
+        and returns the weighted score per candidate name (higher is better).
+        `prices` overrides the candidates' own prices (used for what-if pricing).
+        """
+        scores: Dict[str, float] = {}
+        if not candidates:
+            return scores
+
+        if prices is None:
+            prices = [c.price for c in candidates]
+        delivery_days = [c.delivery_days for c in candidates]
+        quality_scores = [c.quality_score for c in candidates]
+
+        min_price, max_price = min(prices), max(prices)
+        min_days, max_days = min(delivery_days), max(delivery_days)
+        min_quality, max_quality = min(quality_scores), max(quality_scores)
+        epsilon = 1e-9
+
+        for c, price in zip(candidates, prices):
+            norm_price = 1 - ((price - min_price) / (max_price - min_price + epsilon))
+            norm_delivery = 1 - ((c.delivery_days - min_days) / (max_days - min_days + epsilon))
+            norm_quality = (c.quality_score - min_quality) / (max_quality - min_quality + epsilon)
+
+            final_score = (
+                    (norm_price * preferences.price_weight) +
+                    (norm_delivery * preferences.delivery_weight) +
+                    (norm_quality * preferences.quality_weight)
+            )
+            scores[c.name] = final_score
+        return scores
+
     def find_constrained_optimal_setup(
             self,
             detected_items: List[DetectedItem],
             candidates_map: Dict[str, List[MarketCandidate]],
             preferences: UserPreferences,
             max_total_budget: float,
-            fixed_items: Optional[Dict[str, str]] = None
+            fixed_items: Optional[Dict[str, str]] = None,
+            max_delivery_days: Optional[int] = None,
     ) -> Optional[Solution]:
-
+        """
+        Best-scoring combination (one candidate per item) within the budget. Costs use each
+        candidate's quantity-tier price. Candidates that miss `max_delivery_days`, or whose
+        stock / minimum order doesn't fit the quantity, are dropped before the search, and
+        branches that can no longer fit the budget even with the cheapest remaining
+        candidates are cut early.
+        """
         fixed_items = fixed_items or {}
         final_selections: Dict[str, MarketCandidate] = {}
         remaining_budget = max_total_budget
@@ -148,8 +320,10 @@ class ProcurementOptimizer:
                 found = False
                 for candidate in candidates_map.get(item.name, []):
                     if candidate.name == chosen_candidate_name:
+                        if not candidate.can_supply(item.quantity, max_delivery_days):
+                            return None
                         final_selections[item.name] = candidate
-                        remaining_budget -= candidate.price * quantity_map[item.name]
+                        remaining_budget -= candidate.cost(quantity_map[item.name])
                         found = True
                         break
                 if not found:
@@ -161,75 +335,647 @@ class ProcurementOptimizer:
             return None
 
         if not items_to_optimize:
-            total_cost = sum(c.price * quantity_map[name] for name, c in final_selections.items())
+            total_cost = sum(c.cost(quantity_map[name]) for name, c in final_selections.items())
             max_delivery = max(c.delivery_days for c in final_selections.values()) if final_selections else 0
             return Solution(selections=final_selections, total_cost=total_cost, max_delivery_days=max_delivery)
 
-        normalized_scores: Dict[str, Dict[str, float]] = {}
+        scoring_start = time.perf_counter()
+        # Per item: (candidate, cost, score) for every candidate that can take the whole order in time
+        options: List[List[Tuple[MarketCandidate, float, float]]] = []
         for item in items_to_optimize:
             candidates = candidates_map.get(item.name, [])
-            if not candidates:
-                continue
-
-            normalized_scores[item.name] = {}
-            prices = [c.price for c in candidates]
-            delivery_days = [c.delivery_days for c in candidates]
-            quality_scores = [c.quality_score for c in candidates]
-
-            min_price, max_price = min(prices), max(prices)
-            min_days, max_days = min(delivery_days), max(delivery_days)
-            min_quality, max_quality = min(quality_scores), max(quality_scores)
-            epsilon = 1e-9
-
-            for c in candidates:
-                norm_price = 1 - ((c.price - min_price) / (max_price - min_price + epsilon))
-                norm_delivery = 1 - ((c.delivery_days - min_days) / (max_days - min_days + epsilon))
-                norm_quality = (c.quality_score - min_quality) / (max_quality - min_quality + epsilon)
-
-                final_score = (
-                        (norm_price * preferences.price_weight) +
-                        (norm_delivery * preferences.delivery_weight) +
-                        (norm_quality * preferences.quality_weight)
-                )
-                normalized_scores[item.name][c.name] = final_score
+            prices = [c.unit_price(item.quantity) for c in candidates]
+            scores = self.score_candidates(candidates, preferences, prices)
+            eligible = [
+                (c, price * item.quantity, scores[c.name])
+                for c, price in zip(candidates, prices) if c.can_supply(item.quantity, max_delivery_days)
+            ]
+            if not eligible:
+                self.stats["scoring_seconds"] = time.perf_counter() - scoring_start
+                return None
+            options.append(eligible)
+        self.stats["scoring_seconds"] = time.perf_counter() - scoring_start
+
+        # cheapest_rest[i]: least the items from i onwards can cost
+        cheapest_rest = [0.0] * (len(options) + 1)
+        for index in reversed(range(len(options))):
+            cheapest_rest[index] = cheapest_rest[index + 1] + min(cost for _, cost, _ in options[index])
+        # Slack so float rounding in the bound never cuts a combination that fits exactly
+        budget_slack = 1e-9 * max(1.0, abs(remaining_budget))
 
         best_solution = {"score": -1.0, "combination": None}
+        search_stats = {"nodes": 0}
+        current_combination: List[MarketCandidate] = []
 
-        def solve(item_index: int, current_combination: Dict[str, MarketCandidate]):
-            if item_index == len(items_to_optimize):
-                current_cost = sum(
-                    c.price * quantity_map[name]
-                    for name, c in current_combination.items()
-                )
-
+        def solve(item_index: int, current_cost: float, current_score: float):
+            search_stats["nodes"] += 1
+            if current_cost + cheapest_rest[item_index] > remaining_budget + budget_slack:
+                return
+            if item_index == len(options):
                 if current_cost > remaining_budget:
                     return
-
-                total_score = sum(normalized_scores[name][c.name] for name, c in current_combination.items())
-
-                if total_score > best_solution["score"]:
-                    best_solution["score"] = total_score
-                    best_solution["combination"] = current_combination.copy()
+                if current_score > best_solution["score"]:
+                    best_solution["score"] = current_score
+                    best_solution["combination"] = list(current_combination)
                 return
 
-            current_item = items_to_optimize[item_index]
-            for candidate in candidates_map.get(current_item.name, []):
-                current_combination[current_item.name] = candidate
-                solve(item_index + 1, current_combination)
-                del current_combination[current_item.name]
+            for candidate, cost, score in options[item_index]:
+                current_combination.append(candidate)
+                solve(item_index + 1, current_cost + cost, current_score + score)
+                current_combination.pop()
 
-        solve(0, {})
+        solve_start = time.perf_counter()
+        solve(0, 0.0, 0.0)
+        self.stats["solve_seconds"] = time.perf_counter() - solve_start
+        self.stats["nodes_explored"] = search_stats["nodes"]
 
         if not best_solution["combination"]:
             return None
 
-        final_selections.update(best_solution["combination"])
+        final_selections.update(
+            (item.name, candidate) for item, candidate in zip(items_to_optimize, best_solution["combination"])
+        )
 
-        total_cost = sum(c.price * quantity_map[name] for name, c in final_selections.items())
+        total_cost = sum(c.cost(quantity_map[name]) for name, c in final_selections.items())
         max_delivery_days = max(c.delivery_days for c in final_selections.values())
 
         return Solution(
             selections=final_selections,
             total_cost=total_cost,
             max_delivery_days=max_delivery_days,
-        )
\ No newline at end of file
+        )
+
+    @staticmethod
+    def _cost_steps(cost: float, unit: float, steps: int) -> int:
+        """
+        `cost` in budget steps of size `unit`, rounded up so anything the tables call
+        feasible really fits the budget. With no budget left (`unit` 0) only free options
+        fit; anything else weighs more than the whole grid.
+        """
+        if unit <= 0:
+            return 0 if cost <= 0 else steps + 1
+        return max(0, math.ceil(cost / unit - 1e-9))
+
+    @staticmethod
+    def _add_choice(
+            table: List[float],
+            options: List[Tuple[int, float]],
+            steps: int,
+    ) -> Tuple[List[float], List[int]]:
+        """
+        One multiple-choice knapsack step over a budget grid. `table[b]` is the best value
+        within `b` budget steps so far; exactly one of `options` (weight in steps, value) is
+        added. Returns the new table and, per budget, the index of the option that won.
+        Tables are non-decreasing in `b` (-inf where nothing fits).
+        """
+        combined = [float("-inf")] * (steps + 1)
+        choice = [-1] * (steps + 1)
+        for position, (weight, value) in enumerate(options):
+            for b in range(weight, steps + 1):
+                total = table[b - weight] + value
+                if total > combined[b]:
+                    combined[b] = total
+                    choice[b] = position
+        return combined, choice
+
+    @staticmethod
+    def _combine_budgets(
+            before: List[float],
+            after: List[float],
+            steps: int,
+    ) -> Tuple[List[float], List[int]]:
+        """
+        Max-plus convolution of two budget tables: the best total when `r` budget steps are
+        split between them. Returns the combined table and, per budget, the share given to
+        `before`. Both tables are non-decreasing, so only the budgets where `before`
+        improves need to be tried.
+        """
+        negative_infinity = float("-inf")
+        breakpoints = [
+            b for b in range(steps + 1)
+            if before[b] > negative_infinity and (b == 0 or before[b] > before[b - 1])
+        ]
+        best = [negative_infinity] * (steps + 1)
+        split = [0] * (steps + 1)
+        for r in range(steps + 1):
+            for b in breakpoints:
+                if b > r:
+                    break
+                value = before[b] + after[r - b]
+                if value > best[r]:
+                    best[r] = value
+                    split[r] = b
+        return best, split
+
+    def price_sensitivity(
+            self,
+            detected_items: List[DetectedItem],
+            candidates_map: Dict[str, List[MarketCandidate]],
+            preferences: UserPreferences,
+            max_total_budget: float,
+            fixed_items: Optional[Dict[str, str]] = None,
+            max_delivery_days: Optional[int] = None,
+            budget_steps: int = SENSITIVITY_BUDGET_STEPS,
+    ) -> Optional[Tuple[List[CandidateSensitivity], float]]:
+        """
+        Price thresholds for every candidate of every non-fixed item, from one set of DP tables.
+
+        The problem is a multiple-choice knapsack over the remaining budget (rounded up to
+        `budget_steps` steps). `forward[i][b]` is the best score of items before i within
+        budget b and `backward[i][b]` the best score of items from i on. Combining the two
+        around item i gives the best the *other* items can do with any budget, so whether a
+        candidate wins its item at a given price is an O(candidates) check and each threshold
+        is a bisection over those checks, instead of a full re-solve per candidate.
+
+        Returns `(results, budget_resolution)`, or None when there is no feasible solution.
+        """
+        fixed_items = fixed_items or {}
+        remaining_budget = max_total_budget
+        items_to_analyze: List[DetectedItem] = []
+
+        for item in detected_items:
+            if item.name in fixed_items:
+                fixed = next((c for c in candidates_map.get(item.name, []) if c.name == fixed_items[item.name]), None)
+                if fixed is None or not fixed.can_supply(item.quantity, max_delivery_days):
+                    return None
+                remaining_budget -= fixed.cost(item.quantity)
+            elif candidates_map.get(item.name):
+                items_to_analyze.append(item)
+            else:
+                return None
+
+        if remaining_budget < 0:
+            return None
+        if not items_to_analyze:
+            return [], 0.0
+
+        steps = max(1, budget_steps)
+        unit = remaining_budget / steps
+        negative_infinity = float("-inf")
+
+        def to_steps(cost: float) -> int:
+            return self._cost_steps(cost, unit, steps)
+
+        scoring_start = time.perf_counter()
+        item_prices = [[c.unit_price(item.quantity) for c in candidates_map[item.name]] for item in items_to_analyze]
+        item_scores = [
+            self.score_candidates(candidates_map[item.name], preferences, prices)
+            for item, prices in zip(items_to_analyze, item_prices)
+        ]
+        self.stats["scoring_seconds"] = time.perf_counter() - scoring_start
+
+        solve_start = time.perf_counter()
+
+        options = [
+            [
+                (to_steps(price * item.quantity), item_scores[index][c.name])
+                for c, price in zip(candidates_map[item.name], item_prices[index])
+                if c.can_supply(item.quantity, max_delivery_days)
+            ]
+            for index, item in enumerate(items_to_analyze)
+        ]
+        count = len(items_to_analyze)
+        forward = [[0.0] * (steps + 1)]
+        for index in range(count):
+            forward.append(self._add_choice(forward[-1], options[index], steps)[0])
+        backward = [[0.0] * (steps + 1)]
+        for index in reversed(range(count)):
+            backward.append(self._add_choice(backward[-1], options[index], steps)[0])
+        backward.reverse()
+
+        def others_best(index: int) -> List[float]:
+            return self._combine_budgets(forward[index], backward[index + 1], steps)[0]
+
+        results: List[CandidateSensitivity] = []
+        for index, item in enumerate(items_to_analyze):
+            candidates = candidates_map[item.name]
+            others = others_best(index)
+            base_prices = item_prices[index]
+
+            def value_at(position: int, prices: List[float], scores: Dict[str, float]) -> float:
+                if not candidates[position].can_supply(item.quantity, max_delivery_days):
+                    return negative_infinity
+                weight = to_steps(prices[position] * item.quantity)
+                if weight > steps or others[steps - weight] == negative_infinity:
+                    return negative_infinity
+                return scores[candidates[position].name] + others[steps - weight]
+
+            def wins_at(position: int, price: float) -> bool:
+                prices = list(base_prices)
+                prices[position] = price
+                scores = self.score_candidates(candidates, preferences, prices)
+                own = value_at(position, prices, scores)
+                if own == negative_infinity:
+                    return False
+                return all(own >= value_at(j, prices, scores) for j in range(len(candidates)) if j != position)
+
+            base_scores = item_scores[index]
+            base_values = [value_at(j, base_prices, base_scores) for j in range(len(candidates))]
+            selected = max(range(len(candidates)), key=lambda j: base_values[j])
+            if base_values[selected] == negative_infinity:
+                return None
+
+            # Most an item's candidate can cost and still fit next to the cheapest of everything else
+            price_ceiling = remaining_budget / item.quantity if item.quantity > 0 else 0.0
+            for position, c in enumerate(candidates):
+                is_selected = position == selected
+                current_price = base_prices[position]
+                if is_selected:
+                    low, high = current_price, price_ceiling
+                else:
+                    low, high = 0.0, current_price
+                    if not wins_at(position, 0.0):
+                        results.append(CandidateSensitivity(
+                            item_name=item.name, candidate_name=c.name, current_price=current_price, is_selected=False,
+                        ))
+                        continue
+                # Winning is monotone in the candidate's own price: find the highest price that still wins
+                if is_selected and wins_at(position, high):
+                    low = high
+                while high - low > 0.005:
+                    middle = (low + high) / 2
+                    if wins_at(position, middle):
+                        low = middle
+                    else:
+                        high = middle
+                threshold = math.floor(low * 100) / 100
+                results.append(CandidateSensitivity(
+                    item_name=item.name,
+                    candidate_name=c.name,
+                    current_price=current_price,
+                    is_selected=is_selected,
+                    threshold_price=threshold,
+                    headroom=round(threshold - current_price if is_selected else current_price - threshold, 2),
+                ))
+
+        self.stats["solve_seconds"] = time.perf_counter() - solve_start
+        return results, unit
+
+    def find_batch_optimal_setup(
+            self,
+            sites: List[Tuple[List[DetectedItem], Optional[float], Dict[str, str]]],
+            candidates_map: Dict[str, List[MarketCandidate]],
+            preferences: UserPreferences,
+            max_total_budget: float,
+            max_delivery_days: Optional[int] = None,
+            budget_steps: int = BATCH_BUDGET_STEPS,
+    ) -> Optional[List[Dict[str, int]]]:
+        """
+        Jointly optimizes several sites, given as `(detected_items, budget_cap, fixed_items)`,
+        against one shared budget so that the summed score of all sites is maximal.
+
+        Candidates are shared by item name, so each item is scored once for the whole batch.
+        Every site becomes a budget table (best site score within each budget, capped at the
+        site's own cap) built with the same knapsack steps as `price_sensitivity`; sites with
+        the same items to optimize, quantities and remaining cap share one table. The site tables are
+        then combined over the shared pool and the winning split is traced back.
+
+        `max_delivery_days` is a deadline for every site. Returns, per site, the chosen
+        candidate index for each item (fixed items included), or None when some site has
+        no solution within the pool and its cap.
+        """
+        negative_infinity = float("-inf")
+        remaining_budget = max_total_budget
+        site_plans = []  # (items to optimize, fixed indices, cap left after fixed items)
+
+        for detected_items, budget_cap, fixed_items in sites:
+            fixed_indices: Dict[str, int] = {}
+            fixed_cost = 0.0
+            items_to_optimize: List[DetectedItem] = []
+            for item in detected_items:
+                candidates = candidates_map.get(item.name, [])
+                if item.name in fixed_items:
+                    position = next((j for j, c in enumerate(candidates) if c.name == fixed_items[item.name]), None)
+                    if position is None or not candidates[position].can_supply(item.quantity, max_delivery_days):
+                        return None
+                    fixed_indices[item.name] = position
+                    fixed_cost += candidates[position].cost(item.quantity)
+                elif candidates:
+                    items_to_optimize.append(item)
+                else:
+                    return None
+            remaining_budget -= fixed_cost
+            site_cap = None if budget_cap is None else budget_cap - fixed_cost
+            if site_cap is not None and site_cap < 0:
+                return None
+            site_plans.append((items_to_optimize, fixed_indices, site_cap))
+
+        if remaining_budget < 0:
+            return None
+
+        steps = max(1, budget_steps)
+        unit = remaining_budget / steps
+
+        def to_steps(cost: float) -> int:
+            return self._cost_steps(cost, unit, steps)
+
+        scoring_start = time.perf_counter()
+        # Tier prices make scores depend on quantity, so share them per (item, quantity)
+        item_keys = {(item.name, item.quantity) for items, _, _ in site_plans for item in items}
+        item_scores = {
+            (name, quantity): self.score_candidates(
+                candidates_map[name], preferences, [c.unit_price(quantity) for c in candidates_map[name]],
+            )
+            for name, quantity in item_keys
+        }
+        self.stats["scoring_seconds"] = time.perf_counter() - scoring_start
+
+        solve_start = time.perf_counter()
+        # signature -> (site table, per-item choice tables, per-item weights)
+        site_tables: Dict[Tuple, Tuple[List[float], List[List[int]], List[List[int]]]] = {}
+        signatures = []
+        for items_to_optimize, fixed_indices, site_cap in site_plans:
+            cap_steps = steps if site_cap is None or unit <= 0 else min(steps, math.floor(site_cap / unit + 1e-9))
+            signature = (tuple((item.name, item.quantity) for item in items_to_optimize), cap_steps)
+            signatures.append(signature)
+            if signature in site_tables:
+                continue
+
+            table = [0.0] * (steps + 1)
+            choices: List[List[int]] = []
+            weights: List[List[int]] = []
+            for item in items_to_optimize:
+                # A candidate that can't take the order weighs more than the whole pool, so it never fits
+                item_weights = [
+                    to_steps(c.cost(item.quantity)) if c.can_supply(item.quantity, max_delivery_days) else steps + 1
+                    for c in candidates_map[item.name]
+                ]
+                scores = item_scores[(item.name, item.quantity)]
+                options = [(w, scores[c.name]) for w, c in zip(item_weights, candidates_map[item.name])]
+                table, choice = self._add_choice(table, options, steps)
+                choices.append(choice)
+                weights.append(item_weights)
+            # Budget beyond the site's cap is worth nothing to it
+            capped = table[:cap_steps + 1] + [table[cap_steps]] * (steps - cap_steps)
+            site_tables[signature] = (capped, choices, weights)
+
+        pool = [0.0] * (steps + 1)
+        splits: List[List[int]] = []
+        for signature in signatures:
+            pool, split = self._combine_budgets(pool, site_tables[signature][0], steps)
+            splits.append(split)
+            self.stats["nodes_explored"] += steps + 1
+        if pool[steps] == negative_infinity:
+            self.stats["solve_seconds"] = time.perf_counter() - solve_start
+            return None
+
+        # Trace the pool split back, then each site's item choices within its share
+        results: List[Dict[str, int]] = [{} for _ in site_plans]
+        budget = steps
+        for site_index in reversed(range(len(site_plans))):
+            before = splits[site_index][budget]
+            # The site's table is flat past its cap, so the cap is all it actually spends
+            site_budget = min(budget - before, signatures[site_index][1])
+            budget = before
+
+            items_to_optimize, fixed_indices, _ = site_plans[site_index]
+            _, choices, weights = site_tables[signatures[site_index]]
+            for item_index in reversed(range(len(items_to_optimize))):
+                position = choices[item_index][site_budget]
+                results[site_index][items_to_optimize[item_index].name] = position
+                site_budget -= weights[item_index][position]
+            results[site_index].update(fixed_indices)
+
+        self.stats["solve_seconds"] = time.perf_counter() - solve_start
+        # The grid rounds costs up, so this holds by construction; never hand out a plan that overspends
+        site_costs = [
+            sum(candidates_map[item.name][result[item.name]].cost(item.quantity) for item in detected_items)
+            for (detected_items, _, _), result in zip(sites, results)
+        ]
+        overspent = sum(site_costs) > max_total_budget + 1e-6 or any(
+            budget_cap is not None and cost > budget_cap + 1e-6 for (_, budget_cap, _), cost in zip(sites, site_costs)
+        )
+        if overspent:
+            log(logger, logging.ERROR, "Batch plan exceeds its budget, discarding it", budget=max_total_budget, cost=sum(site_costs))
+            return None
+        return results
+
+    @staticmethod
+    def _fill_quantity(
+            candidates: List[MarketCandidate],
+            scores: List[float],
+            quantity: int,
+            price_weight: float,
+    ) -> Optional[Tuple[float, float, Dict[int, int]]]:
+        """
+        Splits `quantity` units across `candidates` to maximize score - `price_weight` * cost,
+        where a candidate's score counts in proportion to its share of the units. Each
+        candidate takes 0 units or between its minimum order and its stock.
+
+        DP over candidates with "units filled so far" as the state. Within one price tier a
+        candidate's value is linear in the units it takes, so the best take for every fill
+        level comes from a sliding-window maximum: O(candidates x tiers x quantity) in total,
+        never enumerating individual splits.
+
+        Returns `(score, cost, {candidate_index: units})`, or None if the quantity can't be covered.
+        """
+        negative_infinity = float("-inf")
+        best = [0.0] + [negative_infinity] * quantity
+        takes: List[List[int]] = []
+        for c, score in zip(candidates, scores):
+            # Quantity ranges with a constant unit price, clipped to [min order, stock]
+            upper = quantity if c.stock is None else min(c.stock, quantity)
+            bounds = sorted({c.min_order_quantity} | {
+                t.min_quantity for t in c.price_tiers or [] if c.min_order_quantity < t.min_quantity <= upper
+            })
+            segments = [
+                (low, (bounds[i + 1] - 1) if i + 1 < len(bounds) else upper)
+                for i, low in enumerate(bounds) if low <= upper
+            ]
+
+            updated = list(best)
+            take = [0] * (quantity + 1)
+            for low, high in segments:
+                value = score / quantity - price_weight * c.unit_price(low)
+                window: deque = deque()  # (best[j] - j * value, j), decreasing keys
+                for filled in range(low, quantity + 1):
+                    j = filled - low
+                    if best[j] > negative_infinity:
+                        key = best[j] - j * value
+                        while window and window[-1][0] <= key:
+                            window.pop()
+                        window.append((key, j))
+                    while window and window[0][1] < filled - high:
+                        window.popleft()
+                    if window:
+                        total = window[0][0] + filled * value
+                        if total > updated[filled]:
+                            updated[filled] = total
+                            take[filled] = filled - window[0][1]
+            best = updated
+            takes.append(take)
+
+        if best[quantity] == negative_infinity:
+            return None
+        allocation: Dict[int, int] = {}
+        filled = quantity
+        for position in reversed(range(len(candidates))):
+            units = takes[position][filled]
+            if units:
+                allocation[position] = units
+                filled -= units
+        split_score = sum(scores[position] * units for position, units in allocation.items()) / quantity
+        split_cost = sum(candidates[position].cost(units) for position, units in allocation.items())
+        return split_score, split_cost, allocation
+
+    def _split_options(
+            self,
+            candidates: List[MarketCandidate],
+            scores: List[float],
+            quantity: int,
+    ) -> List[Tuple[float, float, Dict[int, int]]]:
+        """
+        The score/cost trade-off curve of one item: every split that is best for some
+        price weight, found by bisecting between known splits (Eisner-Severance). The first
+        entry is the best-scoring split, the last the cheapest.
+        """
+        best_score = self._fill_quantity(candidates, scores, quantity, 0.0)
+        if best_score is None:
+            return []
+        # Heavy enough that any cost difference outweighs the whole score range
+        cheapest = self._fill_quantity(candidates, scores, quantity, 1e6)
+
+        def between(high: Tuple, low: Tuple) -> List[Tuple]:
+            # `high` scores and costs more than `low`; look for a split on the segment between them
+            if high[1] - low[1] <= 1e-9:
+                return []
+            price_weight = (high[0] - low[0]) / (high[1] - low[1])
+            middle = self._fill_quantity(candidates, scores, quantity, price_weight)
+            if middle[0] - price_weight * middle[1] <= high[0] - price_weight * high[1] + 1e-12:
+                return []
+            return between(high, middle) + [middle] + between(middle, low)
+
+        if cheapest[1] >= best_score[1] - 1e-9:
+            return [best_score]
+        return [best_score] + between(best_score, cheapest) + [cheapest]
+
+    def find_split_sourcing_setup(
+            self,
+            detected_items: List[DetectedItem],
+            candidates_map: Dict[str, List[MarketCandidate]],
+            preferences: UserPreferences,
+            max_total_budget: float,
+            fixed_items: Optional[Dict[str, str]] = None,
+            max_delivery_days: Optional[int] = None,
+            budget_steps: int = SPLIT_BUDGET_STEPS,
+    ) -> Optional[Dict[str, Dict[int, int]]]:
+        """
+        Like `find_constrained_optimal_setup`, but an item's quantity may be split across
+        several candidates (respecting their stock and minimum order quantities). An item's
+        score is the unit-weighted average of its candidates' scores.
+
+        Each item's options for the same multiple-choice knapsack over the budget that the
+        batch search uses are its splits on the convex score/cost curve (see `_split_options`)
+        plus every candidate that can take the whole quantity alone. Costs are rounded up to
+        the grid, which can rule out a single-source plan that fits the budget almost exactly;
+        when the single-source search has at most SPLIT_EXACT_CHECK_MAX_COMBINATIONS
+        combinations its exact optimum is also solved and kept if it scores higher, so small
+        searches never do worse than the default mode. Larger ones can miss a plan within
+        one grid step per item of the budget. Multi-source splits off the convex curve (from
+        tiers or minimum orders) are skipped, so the result can still fall slightly short of
+        the true split optimum.
+
+        Returns `{item_name: {candidate_index: units}}` (fixed items take their whole
+        quantity from the fixed candidate), or None when nothing fits.
+        """
+        fixed_items = fixed_items or {}
+        remaining_budget = max_total_budget
+        allocations: Dict[str, Dict[int, int]] = {}
+        items_to_optimize: List[DetectedItem] = []
+
+        for item in detected_items:
+            candidates = candidates_map.get(item.name, [])
+            if item.name in fixed_items:
+                position = next((j for j, c in enumerate(candidates) if c.name == fixed_items[item.name]), None)
+                if position is None or not candidates[position].can_supply(item.quantity, max_delivery_days):
+                    return None
+                allocations[item.name] = {position: item.quantity}
+                remaining_budget -= candidates[position].cost(item.quantity)
+            elif candidates:
+                items_to_optimize.append(item)
+            else:
+                return None
+
+        if remaining_budget < 0:
+            return None
+
+        scoring_start = time.perf_counter()
+        item_options = []
+        for item in items_to_optimize:
+            candidates = candidates_map[item.name]
+            scores = self.score_candidates(candidates, preferences, [c.unit_price(item.quantity) for c in candidates])
+            # Late candidates stay in the normalization but can't take any units
+            eligible = [
+                j for j, c in enumerate(candidates)
+                if max_delivery_days is None or c.delivery_days <= max_delivery_days
+            ]
+            if item.quantity <= 0:
+                item_options.append([(0.0, 0.0, {})])
+                continue
+            options = self._split_options(
+                [candidates[j] for j in eligible], [scores[candidates[j].name] for j in eligible], item.quantity,
+            )
+            if not options:
+                self.stats["scoring_seconds"] = time.perf_counter() - scoring_start
+                return None
+            # Without tiers or minimum orders the curve's corners are single-source choices only,
+            # so add every single-source choice, not just the ones on the curve
+            single_source = [
+                (scores[c.name], c.cost(item.quantity), {j: item.quantity})
+                for j, c in enumerate(candidates) if c.can_supply(item.quantity, max_delivery_days)
+            ]
+            item_options.append([
+                (score, cost, {eligible[j]: units for j, units in allocation.items()})
+                for score, cost, allocation in options
+            ] + single_source)
+        self.stats["scoring_seconds"] = time.perf_counter() - scoring_start
+
+        solve_start = time.perf_counter()
+        steps = max(1, budget_steps)
+        unit = remaining_budget / steps
+        table = [0.0] * (steps + 1)
+        choices: List[List[int]] = []
+        weights: List[List[int]] = []
+        for options in item_options:
+            option_weights = [self._cost_steps(cost, unit, steps) for _, cost, _ in options]
+            table, choice = self._add_choice(table, [(w, score) for w, (score, _, _) in zip(option_weights, options)], steps)
+            choices.append(choice)
+            weights.append(option_weights)
+            self.stats["nodes_explored"] += len(options)
+        self.stats["solve_seconds"] = time.perf_counter() - solve_start
+
+        split_score = table[steps]
+        if split_score > float("-inf"):
+            budget = steps
+            for index in reversed(range(len(items_to_optimize))):
+                position = choices[index][budget]
+                allocations[items_to_optimize[index].name] = item_options[index][position][2]
+                budget -= weights[index][position]
+
+        # Costs are rounded up to the grid, which can rule out a single-source plan that fits exactly
+        combinations = 1
+        for item in items_to_optimize:
+            combinations *= sum(c.can_supply(item.quantity, max_delivery_days) for c in candidates_map[item.name])
+        single = None
+        if combinations <= SPLIT_EXACT_CHECK_MAX_COMBINATIONS:
+            split_stats = self.stats
+            self.stats = {"nodes_explored": 0, "scoring_seconds": 0.0, "solve_seconds": 0.0}
+            single = self.find_constrained_optimal_setup(
+                detected_items, candidates_map, preferences, max_total_budget, fixed_items, max_delivery_days,
+            )
+            self.stats = {key: split_stats[key] + self.stats[key] for key in split_stats}
+        if single is not None:
+            single_score = 0.0
+            single_allocations: Dict[str, Dict[int, int]] = {}
+            for item in detected_items:
+                candidates = candidates_map[item.name]
+                position = candidates.index(single.selections[item.name])
+                single_allocations[item.name] = {position: item.quantity}
+                if item.name not in fixed_items:
+                    scores = self.score_candidates(candidates, preferences, [c.unit_price(item.quantity) for c in candidates])
+                    single_score += scores[candidates[position].name]
+            if single_score > split_score + 1e-12:
+                return single_allocations
+        if split_score == float("-inf"):
+            return None
+        return {item.name: allocations[item.name] for item in detected_items}
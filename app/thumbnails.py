@@ -0,0 +1,198 @@
+import os
+import io
+import time
+import asyncio
+import hashlib
+import urllib.parse
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .services import find_product_image, normalize_product_name
+from .metrics import stage_timer, CACHE_LOOKUPS
+from .tracing import span
+from .outbound import CallPolicy, CircuitOpenError, breaker, call_with_policy
+
+# --- Thumbnail Store Configuration ---
+THUMBNAILS_ENABLED = os.getenv("THUMBNAILS_ENABLED", "0") == "1"
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", "thumbnails")
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "256"))  # Longest side, in pixels
+# Fetch from here instead of Pollinations, e.g. the load-test stand-in; "{name}" is replaced by the product name
+THUMBNAIL_UPSTREAM_URL = os.getenv("THUMBNAIL_UPSTREAM_URL", "")
+# Pollinations generates the image on the first request, which can take a while
+THUMBNAIL_FETCH_TIMEOUT = float(os.getenv("THUMBNAIL_FETCH_TIMEOUT", "60"))
+THUMBNAIL_FETCH_CONCURRENCY = int(os.getenv("THUMBNAIL_FETCH_CONCURRENCY", "4"))
+
+# A stored thumbnail never changes for a given name and size, so browsers may keep it for a year
+THUMBNAIL_CACHE_CONTROL = "public, max-age=31536000, immutable"
+THUMBNAIL_POLICY = CallPolicy(timeout=THUMBNAIL_FETCH_TIMEOUT, retries=1)
+images_breaker = breaker("images")
+
+MEDIA_TYPES = {".jpg": "image/jpeg", ".png": "image/png", ".webp": "image/webp", ".gif": "image/gif"}
+EXTENSIONS = {media_type: extension for extension, media_type in MEDIA_TYPES.items()}
+
+
+def _is_image_failure(response, error: Optional[BaseException]) -> bool:
+    if error is not None:
+        return True
+    return response.status_code == 429 or response.status_code >= 500
+
+
+def _upstream_url(product_name: str) -> str:
+    if THUMBNAIL_UPSTREAM_URL:
+        return THUMBNAIL_UPSTREAM_URL.replace("{name}", urllib.parse.quote(product_name))
+    return find_product_image(product_name)
+
+
+def _download(url: str) -> Tuple[bytes, str]:
+    import requests
+
+    def send(timeout: float):
+        return requests.get(url, timeout=timeout)
+
+    with stage_timer("thumbnail_fetch"), span("images.fetch", url=url) as fetch_span:
+        response = call_with_policy(send, THUMBNAIL_POLICY, images_breaker, _is_image_failure, "images")
+        fetch_span.set_attribute("http.status_code", response.status_code)
+    response.raise_for_status()
+    media_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+    return response.content, media_type
+
+
+def _resize(data: bytes, media_type: str, size: int) -> Tuple[bytes, str]:
+    """
+    Longest side scaled down to `size`, re-encoded as JPEG. Without Pillow the
+    upstream bytes are kept as they are. Pillow is imported here, on the first resize,
+    so it stays off the cold-start path (and out of the app entirely unless thumbnails are on).
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return data, media_type
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail((size, size))
+        out = io.BytesIO()
+        image.convert("RGB").save(out, format="JPEG", quality=85, optimize=True)
+    return out.getvalue(), "image/jpeg"
+
+
+def validators(path: str) -> Tuple[str, str]:
+    """
+    `(ETag, Last-Modified)` for a stored thumbnail, from its size and mtime.
+    """
+    stat = os.stat(path)
+    etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    return etag, formatdate(stat.st_mtime, usegmt=True)
+
+
+def is_not_modified(
+        path: str,
+        if_none_match: Optional[str],
+        if_modified_since: Optional[str],
+) -> bool:
+    """
+    Conditional-GET check. `If-None-Match` wins over `If-Modified-Since` when both are sent.
+    """
+    etag, _ = validators(path)
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(os.stat(path).st_mtime) <= since
+    return False
+
+
+class ThumbnailStore:
+    """
+    On-disk store of resized product images, one file per normalized product name and size.
+    Each image is fetched from upstream once; concurrent requests for the same missing
+    thumbnail wait on a single fetch, and fetches share a concurrency budget.
+    """
+
+    def __init__(
+            self,
+            directory: str = THUMBNAIL_DIR,
+            size: int = THUMBNAIL_SIZE,
+            concurrency: int = THUMBNAIL_FETCH_CONCURRENCY,
+    ):
+        self.directory = directory
+        self.size = size
+        self.concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._index: Dict[str, str] = {}  # key -> stored file path
+
+    def key_for(self, product_name: str) -> str:
+        normalized = normalize_product_name(product_name)
+        return hashlib.blake2b(f"{normalized}|{self.size}".encode("utf-8"), digest_size=16).hexdigest()
+
+    def _find(self, key: str) -> Optional[str]:
+        path = self._index.get(key)
+        if path is not None and os.path.exists(path):
+            return path
+        for extension in MEDIA_TYPES:
+            candidate = os.path.join(self.directory, f"{key}{extension}")
+            if os.path.exists(candidate):
+                self._index[key] = candidate
+                return candidate
+        return None
+
+    def _fetch_and_store(self, product_name: str, key: str) -> str:
+        data, media_type = _download(_upstream_url(product_name))
+        if not media_type.startswith("image/"):
+            raise ValueError(f"upstream returned {media_type or 'no content type'}, not an image")
+        with stage_timer("thumbnail_resize"):
+            data, media_type = _resize(data, media_type, self.size)
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{key}{EXTENSIONS.get(media_type, '.jpg')}")
+        # Write-then-rename, so a reader never sees a half-written file
+        temporary = f"{path}.{os.getpid()}.{time.monotonic_ns()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+        self._index[key] = path
+        return path
+
+    async def _fetch(self, product_name: str, key: str) -> str:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            try:
+                return await asyncio.to_thread(self._fetch_and_store, product_name, key)
+            except CircuitOpenError as e:
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+            except Exception as e:
+                raise HTTPException(status_code=502, detail=f"Could not fetch an image for '{product_name}': {e}")
+
+    def _forget(self, key: str, future: asyncio.Future):
+        self._inflight.pop(key, None)
+        # Mark a failure retrieved even if every waiter went away before it finished
+        if not future.cancelled():
+            future.exception()
+
+    async def get(self, product_name: str) -> Tuple[str, str]:
+        """
+        Returns `(path, media_type)` of the stored thumbnail, fetching it first if needed.
+        """
+        key = self.key_for(product_name)
+        path = self._find(key)
+        if path is not None:
+            CACHE_LOOKUPS.inc(cache="thumbnail", result="hit")
+        else:
+            CACHE_LOOKUPS.inc(cache="thumbnail", result="miss")
+            future = self._inflight.get(key)
+            if future is None:
+                future = asyncio.ensure_future(self._fetch(product_name, key))
+                self._inflight[key] = future
+                future.add_done_callback(lambda done: self._forget(key, done))
+            # Shielded: one caller disconnecting must not cancel the fetch others wait on
+            path = await asyncio.shield(future)
+        return path, MEDIA_TYPES.get(os.path.splitext(path)[1], "application/octet-stream")
+
+
+thumbnail_store = ThumbnailStore()
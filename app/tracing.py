@@ -0,0 +1,299 @@
+import os
+import json
+import logging
+import time
+import queue
+import hashlib
+import secrets
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# --- Tracing Configuration ---
+# TRACE_EXPORTER: "none" (ids only, nothing exported), "file" (JSON lines) or "http" (OTLP/HTTP JSON batches)
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL", "http://127.0.0.1:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "procurement-api")
+TRACE_BATCH_SIZE = int(os.getenv("TRACE_BATCH_SIZE", "64"))
+# How long shutdown waits for the last spans to be written
+TRACE_SHUTDOWN_TIMEOUT = float(os.getenv("TRACE_SHUTDOWN_TIMEOUT", "5"))
+
+# Header clients can reuse across a whole session so all of its requests share one trace
+TRACE_ID_HEADER = "x-trace-id"
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "end", "attributes", "events", "status")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str]):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attributes: Dict[str, Any] = {}
+        self.events: List[Dict[str, Any]] = []
+        self.status = "ok"
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes: Any):
+        self.events.append({"name": name, "time": time.time(), "attributes": attributes})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": ((self.end or time.time()) - self.start) * 1000,
+            "status": self.status,
+            "attributes": self.attributes,
+            "events": self.events,
+        }
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+def _otlp_id(value: str, length: int) -> str:
+    """
+    OTLP ids are fixed-length hex; session ids sent as `X-Trace-Id` may be any alphanumeric
+    string, so those are hashed into one (the original is kept as an attribute).
+    """
+    if len(value) == length and all(c in "0123456789abcdef" for c in value):
+        return value
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=length // 2).hexdigest()
+
+
+def _otlp_span(record: Dict[str, Any]) -> Dict[str, Any]:
+    attributes = dict(record["attributes"])
+    trace_id = _otlp_id(record["trace_id"], 32)
+    if trace_id != record["trace_id"]:
+        attributes["session.trace_id"] = record["trace_id"]
+    otlp = {
+        "traceId": trace_id,
+        "spanId": record["span_id"],
+        "name": record["name"],
+        "startTimeUnixNano": str(int(record["start"] * 1e9)),
+        "endTimeUnixNano": str(int((record["end"] or record["start"]) * 1e9)),
+        "attributes": _otlp_attributes(attributes),
+        "events": [
+            {"name": event["name"], "timeUnixNano": str(int(event["time"] * 1e9)), "attributes": _otlp_attributes(event["attributes"])}
+            for event in record["events"]
+        ],
+        "status": {"code": 2, "message": str(attributes.get("error", ""))} if record["status"] == "error" else {},
+    }
+    if record["parent_id"]:
+        otlp["parentSpanId"] = _otlp_id(record["parent_id"], 16)
+    return otlp
+
+
+def otlp_payload(batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    An OTLP/HTTP JSON export request (`POST /v1/traces`) for a batch of `Span.to_dict()` records.
+    """
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": TRACE_SERVICE_NAME})},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [_otlp_span(record) for record in batch]}],
+        }]
+    }
+
+
+# Queued by `_Exporter.shutdown()`: write what came before it, then stop
+_STOP = object()
+
+
+class _Exporter:
+    """
+    Ships finished spans from a background thread so the request path only pays for a queue put.
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=10000)
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    def submit(self, span: Span):
+        if self.mode == "none":
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait(span.to_dict())
+        except queue.Full:
+            self.dropped += 1
+
+    def shutdown(self, timeout: float = TRACE_SHUTDOWN_TIMEOUT):
+        """
+        Writes out the spans still queued and stops the thread; called when the app stops.
+        A later span starts a new thread.
+        """
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("Trace queue still full at shutdown; unexported spans are lost")
+            return
+        thread.join(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            record = self._queue.get()
+            while True:
+                if record is _STOP:
+                    stopping = True
+                    break
+                batch.append(record)
+                if len(batch) >= TRACE_BATCH_SIZE:
+                    break
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.warning("Trace export failed: %s", e)
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        if self.mode == "file":
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                for record in batch:
+                    f.write(json.dumps(record) + "\n")
+        elif self.mode == "http":
+            import requests
+            response = requests.post(TRACE_COLLECTOR_URL, json=otlp_payload(batch), timeout=5)
+            response.raise_for_status()
+
+
+exporter = _Exporter(TRACE_EXPORTER)
+
+
+def shutdown_tracing():
+    exporter.shutdown()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    active = _current_span.get()
+    return active.trace_id if active else None
+
+
+@contextmanager
+def span(name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+    """
+    Opens a child of the current span (or a new root) for the duration of the block.
+    """
+    parent = _current_span.get()
+    if parent is not None and trace_id is None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    new_span = Span(name, trace_id or secrets.token_hex(16), parent_id)
+    new_span.attributes.update(attributes)
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.status = "error"
+        new_span.set_attribute("error", repr(e))
+        raise
+    finally:
+        new_span.end = time.time()
+        _current_span.reset(token)
+        exporter.submit(new_span)
+
+
+def add_event(name: str, **attributes: Any):
+    active = _current_span.get()
+    if active is not None:
+        active.add_event(name, **attributes)
+
+
+def propagation_headers() -> Dict[str, str]:
+    """
+    W3C `traceparent` for outbound calls so upstreams can join the trace.
+    """
+    active = _current_span.get()
+    if active is None:
+        return {}
+    return {"traceparent": f"00-{active.trace_id}-{active.span_id}-01"}
+
+
+def _parse_incoming(headers: Dict[str, str]) -> Tuple[Optional[str], Optional[str]]:
+    traceparent = headers.get("traceparent")
+    if traceparent:
+        parts = traceparent.split("-")
+        if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+            return parts[1], parts[2]
+    trace_id = headers.get(TRACE_ID_HEADER)
+    if trace_id and len(trace_id) <= 64 and trace_id.isalnum():
+        return trace_id, None
+    return None, None
+
+
+class TracingMiddleware:
+    """
+    Opens a root span per request, continuing the caller's trace when it sends
+    `traceparent` or `X-Trace-Id`, and echoes the trace id in `X-Trace-Id`.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        trace_id, parent_id = _parse_incoming(headers)
+
+        with span(f"{scope['method']} {scope['path']}", trace_id=trace_id, parent_id=parent_id) as request_span:
+            async def send_wrapper(message: Message):
+                if message["type"] == "http.response.start":
+                    request_span.set_attribute("http.status_code", message["status"])
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (TRACE_ID_HEADER.encode("latin-1"), request_span.trace_id.encode("latin-1"))
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+            route = scope.get("route")
+            if route is not None:
+                request_span.name = f"{scope['method']} {route.path}"
@@ -0,0 +1,76 @@
+"""
+Compares the stock FastAPI response path with ModelResponse + compression
+for a SearchResponse carrying ~1k candidates.
+
+Run from the repo root:  python -m benchmarks.bench_serialization
+"""
+import json
+import time
+import random
+import gzip
+
+from fastapi.encoders import jsonable_encoder
+
+from app.models import MarketCandidate, SearchResponse
+from app.responses import ModelResponse, compress, brotli
+
+ITEM_TYPES = 20
+CANDIDATES_PER_ITEM = 50
+ROUNDS = 50
+
+
+def build_response() -> SearchResponse:
+    rng = random.Random(42)
+    all_candidates = {
+        f"Item {i}": [
+            MarketCandidate(
+                name=f"Vendor {j} Item {i}",
+                price=round(rng.uniform(50.0, 600.0), 2),
+                delivery_days=rng.randint(1, 20),
+                quality_score=round(rng.uniform(0.4, 0.98), 2),
+                url=f"http://example.com/item-{i}-vendor-{j}",
+            )
+            for j in range(CANDIDATES_PER_ITEM)
+        ]
+        for i in range(ITEM_TYPES)
+    }
+    return SearchResponse(all_candidates=all_candidates, initial_solution=None, logs=["benchmark"])
+
+
+def timed(label: str, fn) -> bytes:
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        body = fn()
+    elapsed_ms = (time.perf_counter() - start) / ROUNDS * 1000
+    print(f"{label:<45} {elapsed_ms:8.3f} ms")
+    return body
+
+
+def run():
+    response = build_response()
+    print(f"--- Serializing SearchResponse with {ITEM_TYPES * CANDIDATES_PER_ITEM} candidates ({ROUNDS} rounds) ---")
+
+    def stock_path() -> bytes:
+        # What FastAPI does for a returned model: re-validate, jsonable_encoder, json.dumps
+        validated = SearchResponse.model_validate(response.model_dump())
+        return json.dumps(jsonable_encoder(validated), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    stock = timed("response_model + stdlib json", stock_path)
+    fast = timed("ModelResponse (pydantic-core)", lambda: ModelResponse(response).body)
+    timed("ModelResponse + gzip", lambda: compress(ModelResponse(response).body, "gzip"))
+    if brotli is not None:
+        timed("ModelResponse + brotli", lambda: compress(ModelResponse(response).body, "br"))
+
+    print("\n--- Bytes on the wire ---")
+    print(f"{'stock json':<45} {len(stock):8d}")
+    print(f"{'fast json':<45} {len(fast):8d}")
+    print(f"{'gzip':<45} {len(gzip.compress(fast, 6)):8d}")
+    if brotli is not None:
+        print(f"{'brotli':<45} {len(compress(fast, 'br')):8d}")
+    else:
+        print("brotli not installed, skipped")
+
+
+if __name__ == "__main__":
+    run()
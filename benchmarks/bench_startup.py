@@ -0,0 +1,66 @@
+"""
+Measures cold start: `import app.main` time, and wall time from launching uvicorn
+to the first successfully served request.
+
+Run from the repo root:  python -m benchmarks.bench_startup [--runs 5]
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+import urllib.error
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def import_time_ms() -> float:
+    code = "import time; t = time.perf_counter(); import app.main; print((time.perf_counter() - t) * 1000)"
+    output = subprocess.check_output([sys.executable, "-c", code], text=True)
+    return float(output.strip().splitlines()[-1])
+
+
+def first_request_ms(timeout: float = 30.0) -> float:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/optimizer/cache/stats"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except (urllib.error.URLError, ConnectionError, OSError):
+                time.sleep(0.01)
+        raise RuntimeError("Server did not answer within the timeout")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    imports = [import_time_ms() for _ in range(args.runs)]
+    first = [first_request_ms() for _ in range(args.runs)]
+    print(f"import app.main            median {statistics.median(imports):8.1f} ms   (min {min(imports):.1f})")
+    print(f"launch -> first response   median {statistics.median(first):8.1f} ms   (min {min(first):.1f})")
+    print(f"(OPENAI_API_KEY set: {bool(os.getenv('OPENAI_API_KEY'))})")
+
+
+if __name__ == "__main__":
+    main()
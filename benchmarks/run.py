@@ -0,0 +1,166 @@
+"""
+Benchmark suite for the optimizer, the scoring stage and the /procure/* endpoints.
+
+Results are written to benchmarks/results/<commit>.json. Pass `--compare <file>`
+to diff against an earlier run and flag regressions.
+
+Run from the repo root:  python -m benchmarks.run [--rounds N] [--compare benchmarks/results/<sha>.json]
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import statistics
+import subprocess
+from typing import Callable, Dict, List
+
+# TestClient traffic is all one client; measure the endpoints, not the rate limiter
+os.environ["RATE_LIMIT_ENABLED"] = "0"
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.cache import solution_cache
+from app.services import ProcurementOptimizer
+from benchmarks.workloads import SIZES, PREFERENCES, make_workload, budget_for
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+REGRESSION_THRESHOLD = 1.20  # flag anything 20% slower than the baseline
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def measure(name: str, size: str, rounds: int, fn: Callable[[], object], setup: Callable[[], None] = None) -> Dict:
+    fn()  # warm-up
+    samples: List[float] = []
+    for _ in range(rounds):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    result = {
+        "name": name,
+        "size": size,
+        "rounds": rounds,
+        "median_ms": statistics.median(samples),
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "min_ms": samples[0],
+    }
+    print(f"{name:<32} {size:<10} median {result['median_ms']:10.3f} ms   p95 {result['p95_ms']:10.3f} ms")
+    return result
+
+
+def run_suite(rounds: int) -> List[Dict]:
+    results: List[Dict] = []
+    optimizer = ProcurementOptimizer()
+
+    print("--- Optimizer & scoring ---")
+    for item_count, per_item in SIZES:
+        detected_items, candidates_map = make_workload(item_count, per_item)
+        budget = budget_for(detected_items, candidates_map)
+        size = f"{item_count}x{per_item}"
+
+        results.append(measure("scoring", size, rounds, lambda: [
+            optimizer.score_candidates(candidates, PREFERENCES) for candidates in candidates_map.values()
+        ]))
+        results.append(measure("find_constrained_optimal_setup", size, rounds, lambda: optimizer.find_constrained_optimal_setup(
+            detected_items=detected_items,
+            candidates_map=candidates_map,
+            preferences=PREFERENCES,
+            max_total_budget=budget,
+        )))
+
+    print("\n--- Endpoints (TestClient) ---")
+    with TestClient(app) as client:
+        searched = set()
+        for item_count, per_item in SIZES:
+            detected_items, candidates_map = make_workload(item_count, per_item)
+            budget = budget_for(detected_items, candidates_map)
+            size = f"{item_count}x{per_item}"
+            items_json = [item.model_dump() for item in detected_items]
+            search_payload = {
+                "detected_items": items_json,
+                "preferences": PREFERENCES.model_dump(),
+                "budget": budget,
+            }
+            recalc_payload = dict(
+                search_payload,
+                candidates_map={k: [c.model_dump() for c in v] for k, v in candidates_map.items()},
+                fixed_items={},
+            )
+
+            # /procure/search always generates 3 mock candidates per item
+            if item_count not in searched:
+                searched.add(item_count)
+                results.append(measure(
+                    "POST /procure/search", f"{item_count}x3", rounds,
+                    lambda: client.post("/procure/search", json=search_payload),
+                    setup=solution_cache.clear,
+                ))
+            results.append(measure(
+                "POST /procure/recalculate", size, rounds,
+                lambda: client.post("/procure/recalculate", json=recalc_payload),
+                setup=solution_cache.clear,
+            ))
+            results.append(measure(
+                "POST /procure/recalculate*", size, rounds,
+                lambda: client.post("/procure/recalculate", json=recalc_payload),
+            ))
+    print("(* = repeated identical request, served from the solution cache)")
+    return results
+
+
+def compare(results: List[Dict], baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+
+    print(f"\n--- Compared with {baseline_path} ---")
+    regressions = 0
+    for r in results:
+        before = baseline.get((r["name"], r["size"]))
+        if not before or before["median_ms"] <= 0:
+            continue
+        ratio = r["median_ms"] / before["median_ms"]
+        flag = "REGRESSION" if ratio > REGRESSION_THRESHOLD else ""
+        regressions += bool(flag)
+        print(f"{r['name']:<32} {r['size']:<10} {before['median_ms']:10.3f} -> {r['median_ms']:10.3f} ms  x{ratio:5.2f} {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--output", help="where to write results (default: benchmarks/results/<commit>.json)")
+    args = parser.parse_args()
+
+    results = run_suite(args.rounds)
+
+    commit = current_commit()
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": commit,
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare and compare(results, args.compare):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
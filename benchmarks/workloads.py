@@ -0,0 +1,49 @@
+"""
+Synthetic procurement workloads for the benchmarks.
+"""
+import random
+from typing import Dict, List, Tuple
+
+from app.models import DetectedItem, MarketCandidate, UserPreferences
+
+PREFERENCES = UserPreferences(price_weight=0.5, delivery_weight=0.25, quality_weight=0.25)
+
+# (item types, candidates per item) in increasing search-space size
+SIZES: List[Tuple[int, int]] = [(2, 3), (4, 3), (4, 6), (6, 5), (8, 4), (6, 8)]
+
+
+def make_workload(
+        item_count: int,
+        candidates_per_item: int,
+        seed: int = 42,
+) -> Tuple[List[DetectedItem], Dict[str, List[MarketCandidate]]]:
+    rng = random.Random(seed)
+    detected_items = [
+        DetectedItem(name=f"Item {i}", quantity=rng.randint(1, 20))
+        for i in range(item_count)
+    ]
+    candidates_map = {
+        item.name: [
+            MarketCandidate(
+                name=f"Vendor {j} {item.name}",
+                price=round(rng.uniform(50.0, 600.0), 2),
+                delivery_days=rng.randint(1, 20),
+                quality_score=round(rng.uniform(0.4, 0.98), 2),
+                url=f"http://example.com/{i}/{j}",
+            )
+            for j in range(candidates_per_item)
+        ]
+        for i, item in enumerate(detected_items)
+    }
+    return detected_items, candidates_map
+
+
+def budget_for(detected_items: List[DetectedItem], candidates_map: Dict[str, List[MarketCandidate]]) -> float:
+    """
+    A budget that rules out the priciest combinations, so the budget check actually prunes.
+    """
+    average = sum(
+        item.quantity * sum(c.price for c in candidates_map[item.name]) / len(candidates_map[item.name])
+        for item in detected_items
+    )
+    return round(average, 2)
@@ -107,7 +107,7 @@ def run_demo():
     print_step("3. User Initiates Negotiation")
     frontend_action(f"Calculated cost is too high. Clicking 'Negotiate' on {selected_chair['name']}...")
 
-    neg_start_payload = {"candidate_name": selected_chair["name"]}
+    neg_start_payload = {"candidate_name": selected_chair["name"], "item_name": target_item_name}
     response = requests.post(f"{API_URL}/negotiate/start", json=neg_start_payload)
     conversation_id = response.json()["conversation_id"]
 
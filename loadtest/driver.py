@@ -0,0 +1,160 @@
+"""
+Replays the demo_workflow.py flow (upload -> search -> image -> negotiate -> recalculate)
+against a running backend at a fixed concurrency and reports throughput and
+p50/p95/p99 latency per endpoint.
+
+Run:   python -m loadtest.driver --base-url http://127.0.0.1:8000 --concurrency 20 --sessions 200
+
+Each worker sends its own `X-API-Key` (`loadtest-0`, `loadtest-1`, ...). With rate limiting
+on, the server only buckets by keys listed in RATE_LIMIT_API_KEYS, so start it with
+`RATE_LIMIT_API_KEYS=loadtest-0,loadtest-1,...` (one per worker) to limit each worker as a
+separate client; otherwise all workers share the limits of one address.
+"""
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+
+DEMO_ITEMS = [
+    {"name": "Office Chair", "quantity": 10, "target_material": "Mesh"},
+    {"name": "Standing Desk", "quantity": 5},
+]
+PREFERENCES = {"price_weight": 0.5, "delivery_weight": 0.25, "quality_weight": 0.25}
+BUDGET = 8000.0
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def call(self, client: httpx.AsyncClient, label: str, method: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[label] += 1
+            raise
+        self.latencies[label].append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            self.errors[label] += 1
+        return response
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_session(client: httpx.AsyncClient, recorder: Recorder, image_bytes: bytes, headers: Dict[str, str]):
+    # 1. Image analysis
+    response = await recorder.call(
+        client, "POST /upload-image/", "POST", "/upload-image/",
+        files={"image": ("photo.jpg", image_bytes, "image/jpeg")}, headers=headers,
+    )
+    detected_items = DEMO_ITEMS
+    if response.status_code == 200 and response.json().get("detected_items"):
+        detected_items = response.json()["detected_items"]
+
+    # 2. Search
+    response = await recorder.call(client, "POST /procure/search", "POST", "/procure/search", headers=headers, json={
+        "detected_items": detected_items,
+        "preferences": PREFERENCES,
+        "budget": BUDGET,
+    })
+    if response.status_code != 200:
+        return
+    search_data = response.json()
+    solution = search_data["initial_solution"]
+    if not solution:
+        return
+    target_item, selected = random.choice(list(solution["selections"].items()))
+
+    # 3. Product image
+    await recorder.call(client, "GET /product/image", "GET", "/product/image", headers=headers, params={"name": selected["name"]})
+
+    # 4. Negotiation
+    response = await recorder.call(client, "POST /negotiate/start", "POST", "/negotiate/start", headers=headers, json={
+        "candidate_name": selected["name"],
+    })
+    if response.status_code != 200:
+        return
+    conversation_id = response.json()["conversation_id"]
+
+    response = await recorder.call(client, "POST /negotiate/message", "POST", "/negotiate/message", headers=headers, json={
+        "conversation_id": conversation_id,
+        "message_content": "I need a bulk order. I have a competitor quote. Can you beat it?",
+    })
+    if response.status_code != 200:
+        return
+    parsed_price = response.json().get("parsed_new_price") or selected["price"] * 0.9
+
+    # 5. Recalculate around the negotiated price
+    all_candidates = search_data["all_candidates"]
+    for candidate in all_candidates[target_item]:
+        if candidate["name"] == selected["name"]:
+            candidate["price"] = parsed_price
+    await recorder.call(client, "POST /procure/recalculate", "POST", "/procure/recalculate", headers=headers, json={
+        "detected_items": detected_items,
+        "candidates_map": all_candidates,
+        "preferences": PREFERENCES,
+        "budget": BUDGET,
+        "fixed_items": {target_item: selected["name"]},
+    })
+
+
+async def run_load(base_url: str, concurrency: int, sessions: int, image_path: str, timeout: float) -> Recorder:
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+
+    recorder = Recorder()
+    remaining = iter(range(sessions))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def worker(index: int):
+            # Limited as its own client only if the server lists this key in RATE_LIMIT_API_KEYS
+            headers = {"X-API-Key": f"loadtest-{index}"}
+            for _ in remaining:
+                try:
+                    await run_session(client, recorder, image_bytes, headers)
+                except httpx.HTTPError:
+                    pass
+
+        await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    return recorder
+
+
+def report(recorder: Recorder, elapsed: float, sessions: int):
+    print(f"\n{sessions} sessions in {elapsed:.2f}s  ->  {sessions / elapsed:.2f} sessions/s")
+    print(f"{'endpoint':<28} {'count':>7} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for label, values in sorted(recorder.latencies.items()):
+        values.sort()
+        print(
+            f"{label:<28} {len(values):>7} {recorder.errors[label]:>7} {len(values) / elapsed:>8.2f} "
+            f"{percentile(values, 0.50):>9.1f} {percentile(values, 0.95):>9.1f} {percentile(values, 0.99):>9.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--image", default="photo.jpg")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    recorder = asyncio.run(run_load(args.base_url, args.concurrency, args.sessions, args.image, args.timeout))
+    report(recorder, time.perf_counter() - start, args.sessions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Local stand-ins for the upstream vendors, so the backend can be load-tested offline:
+
+- OpenAI chat completions:  POST /v1/chat/completions
+- NegBot:                   GET/POST /api/vendors/, POST /api/conversations/, POST /api/messages/{id}
+- Product images:           GET /images/{name}  (a generated PNG, like Pollinations)
+
+Run:   python -m loadtest.standins --port 9000 --latency-ms 300 --jitter-ms 100 --error-rate 0.01
+Then start the backend against it:
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1 OPENAI_API_KEY=standin \\
+    NEGBOT_API_BASE=http://127.0.0.1:9000/api NEGBOT_REQUEST_DELAY=0 TTS_ENABLED=0 \\
+    THUMBNAILS_ENABLED=1 THUMBNAIL_UPSTREAM_URL='http://127.0.0.1:9000/images/{name}' \\
+    uvicorn app.main:app --port 8000
+"""
+import json
+import time
+import zlib
+import struct
+import hashlib
+import random
+import asyncio
+import argparse
+import itertools
+from typing import Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Form, HTTPException, Response
+
+# Tunables, overridden from the command line. Each upstream has its own latency.
+CONFIG = {
+    "openai_latency_ms": 1500.0,
+    "negbot_latency_ms": 300.0,
+    "images_latency_ms": 2000.0,
+    "jitter_ms": 100.0,
+    "error_rate": 0.0,
+}
+
+app = FastAPI(title="Upstream stand-ins (OpenAI + NegBot)")
+
+_vendors: List[Dict] = []
+_conversations: Dict[int, Dict] = {}
+_ids = itertools.count(1)
+
+SAMPLE_ITEMS = [
+    {"name": "Office Chair", "quantity": 10, "target_material": "Mesh"},
+    {"name": "Standing Desk", "quantity": 5, "target_material": "Wood"},
+    {"name": "Monitor Arm", "quantity": 5, "target_material": None},
+]
+
+
+async def _simulate(upstream: str):
+    delay = CONFIG[f"{upstream}_latency_ms"] + random.uniform(-CONFIG["jitter_ms"], CONFIG["jitter_ms"])
+    await asyncio.sleep(max(0.0, delay) / 1000)
+    if random.random() < CONFIG["error_rate"]:
+        raise HTTPException(status_code=503, detail=f"Simulated {upstream} failure")
+
+
+# --- OpenAI ---
+
+@app.post("/v1/chat/completions")
+async def chat_completions(payload: Dict):
+    await _simulate("openai")
+    content = {
+        "description": "An open-plan office that needs furnishing.",
+        "tags": ["office", "furniture"],
+        "items": random.sample(SAMPLE_ITEMS, k=random.randint(2, len(SAMPLE_ITEMS))),
+    }
+    return {
+        "id": f"chatcmpl-standin-{next(_ids)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": payload.get("model", "gpt-4o"),
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": json.dumps(content)},
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+# --- NegBot ---
+
+@app.get("/api/vendors/")
+async def list_vendors(team_id: str):
+    await _simulate("negbot")
+    return [v for v in _vendors if v["team_id"] == team_id]
+
+
+@app.post("/api/vendors/")
+async def create_vendor(team_id: str, payload: Dict):
+    await _simulate("negbot")
+    vendor = {"id": next(_ids), "team_id": team_id, **payload}
+    _vendors.append(vendor)
+    return vendor
+
+
+@app.post("/api/conversations/")
+async def create_conversation(team_id: str, payload: Dict):
+    await _simulate("negbot")
+    conversation = {"id": next(_ids), "team_id": team_id, "vendor_id": payload["vendor_id"], "turns": 0}
+    _conversations[conversation["id"]] = conversation
+    return conversation
+
+
+@app.post("/api/messages/{conversation_id}")
+async def send_message(conversation_id: int, team_id: str, content: str = Form(...)):
+    await _simulate("negbot")
+    conversation = _conversations.get(conversation_id)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    conversation["turns"] += 1
+    price = round(random.uniform(80.0, 500.0) * (0.97 ** conversation["turns"]), 2)
+    return {
+        "id": next(_ids),
+        "conversation_id": conversation_id,
+        "role": "vendor",
+        "content": f"Thanks for your interest. For that volume I can offer ${price:,.2f} per unit.",
+    }
+
+
+# --- Product images ---
+
+def _solid_png(width: int, height: int, rgb: bytes) -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    rows = b"".join(b"\x00" + rgb * width for _ in range(height))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+@app.get("/images/{name}")
+async def product_image(name: str):
+    await _simulate("images")
+    # One colour per product, at roughly the size Pollinations returns
+    return Response(_solid_png(1024, 1024, hashlib.md5(name.encode()).digest()[:3]), media_type="image/png")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--openai-latency-ms", type=float, default=CONFIG["openai_latency_ms"])
+    parser.add_argument("--negbot-latency-ms", type=float, default=CONFIG["negbot_latency_ms"])
+    parser.add_argument("--images-latency-ms", type=float, default=CONFIG["images_latency_ms"])
+    parser.add_argument("--jitter-ms", type=float, default=CONFIG["jitter_ms"])
+    parser.add_argument("--error-rate", type=float, default=CONFIG["error_rate"], help="0.0-1.0, fraction of calls that fail with 503")
+    args = parser.parse_args()
+
+    CONFIG.update(
+        openai_latency_ms=args.openai_latency_ms,
+        negbot_latency_ms=args.negbot_latency_ms,
+        images_latency_ms=args.images_latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+from fastapi.testclient import TestClient
+from app.main import app
+
+
+def validate_malformed_frames():
+    """
+    Sends frames the negotiation socket can't use and checks that each gets an error
+    reply while the connection stays open.
+    """
+    print("--- Validating the negotiation WebSocket against malformed frames ---")
+    with TestClient(app) as client:
+        with client.websocket_connect("/negotiate/ws/1") as websocket:
+            for label, send in [
+                ("binary frame", lambda: websocket.send_bytes(b"\x00\x01binary")),
+                ("invalid JSON", lambda: websocket.send_text("not json")),
+                ("empty text frame", lambda: websocket.send_text("")),
+                ("missing message_content", lambda: websocket.send_json({})),
+            ]:
+                send()
+                reply = websocket.receive_json()
+                assert reply["type"] == "error", f"Expected an error frame for the {label}, got {reply}"
+                print(f"Assertion Passed: {label} -> {reply['detail']}")
+    print("--- The socket stayed open through every malformed frame ---")
+
+
+if __name__ == "__main__":
+    validate_malformed_frames()
@@ -0,0 +1,263 @@
+import math
+import time
+import random
+import itertools
+from typing import Dict, List, Optional, Tuple
+
+from app.models import DetectedItem, MarketCandidate, PriceTier, UserPreferences
+from app.services import ProcurementOptimizer
+
+# Small enough to brute-force every combination
+ROUNDS = 1000
+EPSILON = 1e-6
+# Split mode on a search far too large to brute-force must stay within these
+SCALING_ITEMS, SCALING_CANDIDATES = 12, 10
+SCALING_MAX_SECONDS = 1.0
+SCALING_MAX_NODES_PER_ITEM = 50
+
+
+def random_candidate(rng: random.Random, name: str, tiers: bool, whole: bool = False) -> MarketCandidate:
+    price = float(rng.randint(5, 120)) if whole else round(rng.uniform(5, 120), 2)
+    candidate = MarketCandidate(
+        name=name,
+        price=price,
+        delivery_days=rng.randint(1, 10),
+        quality_score=round(rng.uniform(0.1, 1.0), 2),
+        url="",
+    )
+    if tiers and rng.random() < 0.5:
+        tier_price = price * rng.uniform(0.6, 0.95)
+        candidate.price_tiers = [PriceTier(
+            min_quantity=rng.randint(2, 6), unit_price=float(math.ceil(tier_price)) if whole else round(tier_price, 2),
+        )]
+    if tiers and rng.random() < 0.3:
+        candidate.stock = rng.randint(1, 8)
+    if tiers and rng.random() < 0.3:
+        candidate.min_order_quantity = rng.randint(1, 3)
+    return candidate
+
+
+def random_problem(rng: random.Random, tiers: bool, whole: bool = False):
+    """
+    `whole` makes every price and the budget whole dollars: solved with one budget step per
+    dollar, the DP grid then loses nothing to rounding and must match brute force exactly.
+    """
+    items = [DetectedItem(name=f"item{i}", quantity=rng.randint(1, 6)) for i in range(rng.randint(1, 3))]
+    candidates_map = {
+        item.name: [random_candidate(rng, f"{item.name}-c{j}", tiers, whole) for j in range(rng.randint(2, 4))]
+        for item in items
+    }
+    weights = [rng.random() for _ in range(3)]
+    preferences = UserPreferences(
+        price_weight=weights[0] / sum(weights),
+        delivery_weight=weights[1] / sum(weights),
+        quality_weight=weights[2] / sum(weights),
+    )
+    cheapest = sum(min(c.cost(item.quantity) for c in candidates_map[item.name]) for item in items)
+    # Zero, tight and loose budgets
+    budget = rng.choice([0.0, round(cheapest * rng.uniform(0.8, 1.3), 2), round(cheapest * rng.uniform(1.3, 3.0), 2)])
+    if whole:
+        budget = float(round(budget))
+    deadline = rng.choice([None, None, rng.randint(3, 10)])
+    return items, candidates_map, preferences, budget, deadline
+
+
+def item_scores(candidates: List[MarketCandidate], preferences: UserPreferences, quantity: int) -> Dict[str, float]:
+    return ProcurementOptimizer.score_candidates(candidates, preferences, [c.unit_price(quantity) for c in candidates])
+
+
+def brute_force(items, candidates_map, preferences, budget, deadline, forced=None) -> Optional[Tuple[float, Tuple[int, ...]]]:
+    """
+    Best single-source `(score, candidate indices)` by trying every combination.
+    `forced` is an optional `(item index, candidate index)` every combination must use.
+    """
+    best: Optional[Tuple[float, Tuple[int, ...]]] = None
+    for combination in itertools.product(*(range(len(candidates_map[item.name])) for item in items)):
+        if forced is not None and combination[forced[0]] != forced[1]:
+            continue
+        chosen = [candidates_map[item.name][j] for item, j in zip(items, combination)]
+        if not all(c.can_supply(item.quantity, deadline) for item, c in zip(items, chosen)):
+            continue
+        if sum(c.cost(item.quantity) for item, c in zip(items, chosen)) > budget + EPSILON:
+            continue
+        score = sum(item_scores(candidates_map[item.name], preferences, item.quantity)[c.name] for item, c in zip(items, chosen))
+        if best is None or score > best[0]:
+            best = (score, combination)
+    return best
+
+
+def validate_sensitivity(rng: random.Random):
+    optimizer = ProcurementOptimizer()
+    for _ in range(ROUNDS):
+        items, candidates_map, preferences, budget, deadline = random_problem(rng, tiers=True)
+        expected = brute_force(items, candidates_map, preferences, budget, deadline)
+        result = optimizer.price_sensitivity(items, candidates_map, preferences, budget, {}, deadline)
+        if expected is None:
+            assert result is None, f"Sensitivity found a solution where none fits the budget {budget}"
+            continue
+        if result is None:
+            continue  # The budget grid rounds up, so a plan that fits exactly can be missed
+        selected = {r.item_name: r.candidate_name for r in result[0] if r.is_selected}
+        spent = sum(
+            next(c for c in candidates_map[item.name] if c.name == selected[item.name]).cost(item.quantity)
+            for item in items
+        )
+        assert spent <= budget + EPSILON, f"Sensitivity selection costs {spent:.2f} over a budget of {budget:.2f}"
+    print("Sensitivity selections fit the budget.")
+
+
+def can_win(items, candidates_map, preferences, budget, deadline, index: int, position: int, price: float) -> bool:
+    """
+    Whether candidate `position` of item `index` is in some optimal plan once its unit price is `price`.
+    """
+    item = items[index]
+    repriced = list(candidates_map[item.name])
+    repriced[position] = repriced[position].model_copy(update={"price": price, "price_tiers": None})
+    problem = dict(candidates_map, **{item.name: repriced})
+    best = brute_force(items, problem, preferences, budget, deadline)
+    forced = brute_force(items, problem, preferences, budget, deadline, forced=(index, position))
+    return forced is not None and forced[0] >= best[0] - EPSILON
+
+
+def validate_sensitivity_thresholds(rng: random.Random):
+    optimizer = ProcurementOptimizer()
+    checked = 0
+    for _ in range(ROUNDS // 4):
+        items, candidates_map, preferences, budget, deadline = random_problem(rng, tiers=True, whole=True)
+        result = optimizer.price_sensitivity(items, candidates_map, preferences, budget, {}, deadline, budget_steps=int(budget))
+        if result is None:
+            assert brute_force(items, candidates_map, preferences, budget, deadline) is None
+            continue
+        for r in result[0]:
+            index = next(i for i, item in enumerate(items) if item.name == r.item_name)
+            position = next(j for j, c in enumerate(candidates_map[r.item_name]) if c.name == r.candidate_name)
+            args = (items, candidates_map, preferences, budget, deadline, index, position)
+            if r.threshold_price is None:
+                assert not can_win(*args, 0.0), f"{r.candidate_name} has no threshold but wins at price 0"
+                continue
+            # Thresholds are floored to the cent after bisecting to half a cent
+            below, above = max(0.0, r.threshold_price - 0.001), r.threshold_price + 0.02
+            if not r.is_selected:
+                above = min(above, r.current_price)
+            assert can_win(*args, below), f"{r.candidate_name} loses just under its threshold {r.threshold_price}"
+            assert not can_win(*args, above), f"{r.candidate_name} still wins above its threshold {r.threshold_price}"
+            checked += 1
+    print(f"Sensitivity thresholds match brute-force re-solves ({checked} thresholds).")
+
+
+def validate_batch(rng: random.Random):
+    optimizer = ProcurementOptimizer()
+    for _ in range(ROUNDS):
+        items, candidates_map, preferences, budget, deadline = random_problem(rng, tiers=True)
+        caps = [None, rng.choice([None, round(budget * rng.uniform(0.3, 0.8), 2)])]
+        sites = [(items, cap, {}) for cap in caps]
+        result = optimizer.find_batch_optimal_setup(sites, candidates_map, preferences, budget, deadline)
+        if result is None:
+            continue
+        costs = [sum(candidates_map[item.name][plan[item.name]].cost(item.quantity) for item in items) for plan in result]
+        assert sum(costs) <= budget + EPSILON, f"Batch plan costs {sum(costs):.2f} over a budget of {budget:.2f}"
+        for cap, cost in zip(caps, costs):
+            assert cap is None or cost <= cap + EPSILON, f"Site plan costs {cost:.2f} over its cap of {cap:.2f}"
+        for plan in result:
+            for item in items:
+                assert candidates_map[item.name][plan[item.name]].can_supply(item.quantity, deadline)
+    print("Batch plans fit the shared budget and every site cap.")
+
+
+def site_plans(items, candidates_map, preferences, cap, deadline) -> List[Tuple[float, float]]:
+    """
+    `(cost, score)` of every feasible plan for one site within its cap.
+    """
+    scores = {item.name: item_scores(candidates_map[item.name], preferences, item.quantity) for item in items}
+    plans = []
+    for chosen in itertools.product(*(candidates_map[item.name] for item in items)):
+        if not all(c.can_supply(item.quantity, deadline) for item, c in zip(items, chosen)):
+            continue
+        cost = sum(c.cost(item.quantity) for item, c in zip(items, chosen))
+        if cap is None or cost <= cap + EPSILON:
+            plans.append((cost, sum(scores[item.name][c.name] for item, c in zip(items, chosen))))
+    return plans
+
+
+def validate_batch_optimal(rng: random.Random):
+    optimizer = ProcurementOptimizer()
+    for _ in range(ROUNDS):
+        items, candidates_map, preferences, budget, deadline = random_problem(rng, tiers=True, whole=True)
+        caps = [None, rng.choice([None, float(round(budget * rng.uniform(0.3, 0.8)))])]
+        sites = [(items, cap, {}) for cap in caps]
+        result = optimizer.find_batch_optimal_setup(sites, candidates_map, preferences, budget, deadline, budget_steps=int(budget))
+
+        first, second = (site_plans(items, candidates_map, preferences, cap, deadline) for cap in caps)
+        expected = max(
+            (a[1] + b[1] for a in first for b in second if a[0] + b[0] <= budget + EPSILON),
+            default=None,
+        )
+        if result is None:
+            assert expected is None, f"Batch found nothing where brute force scores {expected:.4f}"
+            continue
+        scores = {item.name: item_scores(candidates_map[item.name], preferences, item.quantity) for item in items}
+        score = sum(
+            scores[item.name][candidates_map[item.name][plan[item.name]].name] for plan in result for item in items
+        )
+        assert expected is not None and abs(score - expected) <= EPSILON, f"Batch scores {score:.4f}, brute force {expected}"
+    print("Batch plans match the brute-force optimum.")
+
+
+def validate_split(rng: random.Random, tiers: bool):
+    optimizer = ProcurementOptimizer()
+    for _ in range(ROUNDS):
+        items, candidates_map, preferences, budget, deadline = random_problem(rng, tiers)
+        expected = brute_force(items, candidates_map, preferences, budget, deadline)
+        result = optimizer.find_split_sourcing_setup(items, candidates_map, preferences, budget, {}, deadline)
+        if result is None:
+            assert expected is None, f"Split mode found nothing where single-source scores {expected[0]:.4f}"
+            continue
+
+        spent, score = 0.0, 0.0
+        for item in items:
+            candidates = candidates_map[item.name]
+            allocation = result[item.name]
+            assert sum(allocation.values()) == item.quantity, f"{item.name} gets {allocation}, needs {item.quantity}"
+            scores = item_scores(candidates, preferences, item.quantity)
+            for position, units in allocation.items():
+                c = candidates[position]
+                assert units >= c.min_order_quantity and (c.stock is None or units <= c.stock)
+                assert deadline is None or c.delivery_days <= deadline
+                spent += c.cost(units)
+                score += scores[c.name] * units / item.quantity
+        assert spent <= budget + EPSILON, f"Split plan costs {spent:.2f} over a budget of {budget:.2f}"
+        if expected is not None:
+            assert score >= expected[0] - EPSILON, f"Split mode scores {score:.4f}, single-source {expected[0]:.4f}"
+    print(f"Split plans fit the budget and never score below single-source ({'with' if tiers else 'without'} tiers).")
+
+
+def validate_split_scaling(rng: random.Random):
+    items = [DetectedItem(name=f"item{i}", quantity=rng.randint(1, 20)) for i in range(SCALING_ITEMS)]
+    candidates_map = {
+        item.name: [random_candidate(rng, f"{item.name}-c{j}", tiers=True) for j in range(SCALING_CANDIDATES)]
+        for item in items
+    }
+    preferences = UserPreferences(price_weight=0.4, delivery_weight=0.3, quality_weight=0.3)
+    budget = sum(min(c.price for c in candidates_map[item.name]) * item.quantity for item in items) * 1.5
+
+    optimizer = ProcurementOptimizer()
+    start = time.perf_counter()
+    optimizer.find_split_sourcing_setup(items, candidates_map, preferences, budget)
+    elapsed = time.perf_counter() - start
+    nodes = optimizer.stats["nodes_explored"]
+    assert elapsed <= SCALING_MAX_SECONDS, f"Split mode took {elapsed:.2f}s on {SCALING_ITEMS}x{SCALING_CANDIDATES}"
+    assert nodes <= SCALING_MAX_NODES_PER_ITEM * SCALING_ITEMS, f"Split mode explored {nodes} nodes"
+    print(f"Split mode solves {SCALING_ITEMS} items x {SCALING_CANDIDATES} candidates in {elapsed * 1000:.1f} ms ({nodes} nodes).")
+
+
+if __name__ == "__main__":
+    print("--- Validating the DP optimizers against brute force ---")
+    generator = random.Random(7)
+    validate_sensitivity(generator)
+    validate_sensitivity_thresholds(generator)
+    validate_batch(generator)
+    validate_batch_optimal(generator)
+    validate_split(generator, tiers=False)
+    validate_split(generator, tiers=True)
+    validate_split_scaling(generator)
+    print("--- All optimizer checks passed ---")